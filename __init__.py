@@ -64,6 +64,24 @@ import psycopg2.extras
 reload(psycopg2.extras)
 import eveapi
 reload(eveapi)
+import apicache
+reload(apicache)
+import cache
+reload(cache)
+import db
+reload(db)
+import executor
+reload(executor)
+import names
+reload(names)
+import rollups
+reload(rollups)
+import rows
+reload(rows)
+import sde
+reload(sde)
+import sdestore
+reload(sdestore)
 try:
     eveapi.set_user_agent('EVESpai//vittoros@#eve-dev')
 except:
@@ -0,0 +1,345 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Caches for eveapi documents, see the cacheHandler description in
+eveapi.EVEAPIConnection. MemoryCache keeps parsed documents in front of
+the XML kept on disk by DiskCache.
+"""
+
+import collections
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import eveapi
+
+# parameters that must not end up on disk, not even in a file name
+SECRETS = ('vCode', 'apiKey')
+
+
+def cache_key(host, path, params):
+    """
+    Return a SHA-1 of host, path and params, with secrets hashed first.
+    """
+    digest = hashlib.sha1()
+    digest.update('{0}\0{1}'.format(host, path))
+    for key in sorted(params):
+        value = unicode(params[key]).encode('utf-8')
+        if key in SECRETS:
+            value = hashlib.sha1(value).hexdigest()
+        digest.update('\0{0}={1}'.format(key, value))
+    return digest.hexdigest()
+
+
+def expiry(obj):
+    # cachedUntil and currentTime are both server time, so the offset
+    # holds however far the local clock is off
+    return time.time() + obj.cachedUntil - obj.currentTime
+
+
+class _Writer(object):
+    """
+    Writes a document to a temporary file next to its cache file and
+    renames it into place on commit().
+    """
+    def __init__(self, cache, filename, path):
+        self.cache = cache
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        self._done = False
+        directory = os.path.dirname(filename)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        except OSError:
+            # created by another thread in the meantime
+            pass
+        try:
+            fd, self._tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except (IOError, OSError), e:
+            # nothing will be cached, but the document is still read
+            self._done = True
+            if cache.log:
+                cache.log.warning('Could not cache {0}. "{1}"'.format(path,
+                                                                      e))
+            return
+        self._raw = os.fdopen(fd, 'wb')
+        self._gzip = gzip.GzipFile(filename='', mode='wb', fileobj=self._raw)
+
+    def write(self, data):
+        if self._done:
+            return
+        try:
+            self._gzip.write(data)
+        except (IOError, OSError), e:
+            self._fail(e)
+        self.size += len(data)
+
+    def commit(self, obj, expires=None):
+        """
+        Keep the document until expires, by default its cachedUntil. The
+        expiry time is kept as the modification time of the file.
+        """
+        if self._done:
+            return
+        if expires is None:
+            expires = expiry(obj)
+        if expires <= time.time():
+            self.abort()
+            return
+        try:
+            self._close()
+            os.utime(self._tmp, (expires, expires))
+            os.rename(self._tmp, self.filename)
+        except (IOError, OSError), e:
+            self._fail(e)
+            return
+        self._done = True
+        self.cache._count('stores')
+
+    def abort(self):
+        if self._done:
+            return
+        self._done = True
+        try:
+            self._close()
+        except (IOError, OSError):
+            pass
+        self.cache._remove(self._tmp)
+
+    def _close(self):
+        self._gzip.close()
+        self._raw.close()
+
+    def _fail(self, e):
+        self.abort()
+        if self.cache.log:
+            self.cache.log.warning('Could not cache {0}. "{1}"'.format(
+                self.path, e))
+
+
+class DiskCache(object):
+    """
+    Keeps the XML of API documents gzipped in a directory until the
+    cachedUntil time of the document, which is kept as the modification
+    time of the file. Files are named after a SHA-1 of the host, path and
+    parameters, with secret parameters hashed on their own first. Files
+    are replaced atomically, so any number of threads and processes can
+    share the directory.
+    """
+    def __init__(self, path, log=None):
+        self.path = path
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _filename(self, host, path, params):
+        key = cache_key(host, path, params)
+        return os.path.join(self.path, key[:2], key + '.xml.gz')
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def retrieve(self, host, path, params):
+        entry = self.load(host, path, params)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def load(self, host, path, params):
+        """
+        Return (expiry time, XML) of a cached document, or None.
+        """
+        filename = self._filename(host, path, params)
+        try:
+            expires = os.path.getmtime(filename)
+            if expires > time.time():
+                with gzip.open(filename, 'rb') as f:
+                    doc = f.read()
+            else:
+                doc = None
+        except (IOError, OSError):
+            self._count('misses')
+            return None
+        if doc is None:
+            self._count('expired')
+            self._remove(filename)
+            return None
+        self._count('hits')
+        return expires, doc
+
+    def open_store(self, host, path, params):
+        """
+        Return a writer for a document that is still being received.
+        """
+        return _Writer(self, self._filename(host, path, params), path)
+
+    def store(self, host, path, params, doc, obj, expires=None):
+        writer = self.open_store(host, path, params)
+        writer.write(doc)
+        writer.commit(obj, expires)
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def purge(self):
+        """
+        Remove expired documents and stale temporary files.
+        """
+        now = time.time()
+        for directory, _, filenames in os.walk(self.path):
+            for name in filenames:
+                filename = os.path.join(directory, name)
+                try:
+                    mtime = os.path.getmtime(filename)
+                except OSError:
+                    continue
+                if name.endswith('.tmp'):
+                    expired = mtime < now - 3600
+                else:
+                    expired = mtime <= now
+                if expired:
+                    self._remove(filename)
+
+    def __str__(self):
+        return 'API cache: {0} hits, {1} misses, {2} expired, ' \
+            '{3} stored'.format(self.hits, self.misses, self.expired,
+                                self.stores)
+
+
+class _MemoryWriter(object):
+    """
+    Passes a document on to the writer of the disk tier and keeps the
+    parsed object in memory once it is committed.
+    """
+    def __init__(self, cache, key, writer):
+        self.cache = cache
+        self.key = key
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def commit(self, obj):
+        expires = expiry(obj)
+        self.writer.commit(obj, expires)
+        self.cache._add(self.key, expires, obj, self.writer.size)
+
+    def abort(self):
+        self.writer.abort()
+
+
+class MemoryCache(object):
+    """
+    Keeps parsed documents in memory until their cachedUntil, in front of
+    a DiskCache holding their XML. Hits hand eveapi the parsed object, so
+    it neither reads the disk nor parses again. The least recently used
+    documents are dropped beyond max_entries documents or max_bytes bytes
+    of XML, which stands in for the size of the parsed objects.
+    """
+    def __init__(self, backend, max_entries=256, max_bytes=4 << 20):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def retrieve(self, host, path, params):
+        key = cache_key(host, path, params)
+        with self._lock:
+            entry = self._items.pop(key, None)
+            if entry is not None and entry[0] > time.time():
+                self._items[key] = entry
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self.size -= entry[2]
+            self.misses += 1
+        entry = self.backend.load(host, path, params)
+        if entry is None:
+            return None
+        expires, doc = entry
+        obj = eveapi._Parser().Parse(doc, False)
+        self._add(key, expires, obj, len(doc))
+        return obj
+
+    def store(self, host, path, params, doc, obj):
+        expires = expiry(obj)
+        self.backend.store(host, path, params, doc, obj, expires)
+        self._add(cache_key(host, path, params), expires, obj, len(doc))
+
+    def open_store(self, host, path, params):
+        return _MemoryWriter(self, cache_key(host, path, params),
+                             self.backend.open_store(host, path, params))
+
+    def _add(self, key, expires, obj, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._items[key] = (expires, obj, size)
+            self.size += size
+            while len(self._items) > self.max_entries or \
+                    self.size > self.max_bytes:
+                self.size -= self._items.popitem(last=False)[1][2]
+
+    def purge(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+        self.backend.purge()
+
+    def __str__(self):
+        return 'API memory cache: {0} hits, {1} misses, {2} documents, ' \
+            '{3:,d} bytes\n{4}'.format(self.hits, self.misses,
+                                       len(self._items), self.size,
+                                       self.backend)
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,241 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Small thread-safe caches shared by the plugin commands.
+"""
+
+import collections
+import sys
+import threading
+import time
+
+_missing = object()
+
+
+class Memo(object):
+    """
+    Memoizes values by key. Entries stored without a ttl live for the life
+    of the process, the others expire ttl seconds after they were stored.
+    With a maxsize, expired and then the oldest entries are dropped to make
+    room for new ones. Hits and misses are counted.
+    """
+    def __init__(self, name, maxsize=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, expires = self._items.get(key, (_missing, None))
+            if value is not _missing and expires is not None \
+                    and expires <= time.time():
+                del self._items[key]
+                value = _missing
+            if value is _missing:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is not None:
+            expires = time.time() + ttl
+        else:
+            expires = None
+        with self._lock:
+            self._items.pop(key, None)
+            if self.maxsize and len(self._items) >= self.maxsize:
+                self._evict()
+            self._items[key] = (value, expires)
+        return value
+
+    def _evict(self):
+        # must be called with self._lock held
+        now = time.time()
+        for key, (value, expires) in self._items.items():
+            if expires is not None and expires <= now:
+                del self._items[key]
+        while len(self._items) >= self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __str__(self):
+        return '{0}: {1} hits, {2} misses, {3} entries'.format(
+            self.name, self.hits, self.misses, len(self))
+
+
+class Recorder(object):
+    """
+    Stands in for irc while a command runs, passing replies on and keeping
+    a copy of them for replay().
+    """
+    def __init__(self, irc):
+        self._irc = irc
+        self.replies = []
+        self.errors = 0
+
+    def reply(self, *args, **kwargs):
+        self.replies.append(('reply', args, kwargs))
+        return self._irc.reply(*args, **kwargs)
+
+    def error(self, *args, **kwargs):
+        self.replies.append(('error', args, kwargs))
+        self.errors += 1
+        return self._irc.error(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._irc, name)
+
+
+def replay(irc, replies):
+    for method, args, kwargs in replies:
+        getattr(irc, method)(*args, **kwargs)
+
+
+def freeze(value):
+    """
+    Return value with lists turned into tuples, for use in keys.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class Pending(Exception):
+    """
+    Raised by SingleFlight.do() and background() when the call is still
+    running after the caller's timeout.
+    """
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key: while one call runs, the
+    others wait for it and get its result or exception instead of running
+    themselves.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, timeout, f, *args):
+        """
+        Return f(*args), or the result of the call with the same key that
+        is already running. Callers that join a running call wait at most
+        timeout seconds for it, or until it finishes when timeout is None,
+        and then get Pending.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                raise Pending(key)
+            if call.error is not None:
+                raise call.error[0], call.error[1], call.error[2]
+            return call.result
+        try:
+            call.result = f(*args)
+        except BaseException:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def background(self, key, timeout, f, *args):
+        """
+        Like do(), but the call runs on a thread of its own, so the caller
+        that starts it waits at most timeout seconds as well. Callers that
+        stop waiting get Pending, while the call carries on and later
+        callers with the same key wait for it.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                thread = threading.Thread(target=self._background,
+                                          args=(key, call, f, args),
+                                          name='{0} {1!r}'.format(self.name,
+                                                                  key))
+                thread.daemon = True
+                thread.start()
+            else:
+                self.shared += 1
+        if not call.done.wait(timeout):
+            raise Pending(key)
+        if call.error is not None:
+            raise call.error[0], call.error[1], call.error[2]
+        return call.result
+
+    def _background(self, key, call, f, args):
+        try:
+            call.result = f(*args)
+        except BaseException:
+            call.error = sys.exc_info()
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def __str__(self):
+        return '{0}: {1} calls, {2} shared'.format(self.name, self.calls,
+                                                  self.shared)
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -70,9 +70,115 @@ conf.registerGlobalValue(EVESpai, 'sde_user',
 conf.registerGlobalValue(EVESpai, 'sde_password',
                          registry.String ('sde', 'Database \
                          user password'))
+conf.registerGlobalValue(EVESpai, 'stationspinner_pool_min',
+                         registry.NonNegativeInteger(1, 'Connections opened \
+                         when the stationspinner pool is created'))
+conf.registerGlobalValue(EVESpai, 'stationspinner_pool_max',
+                         registry.PositiveInteger(20, 'Maximum number of \
+                         stationspinner connections'))
+conf.registerGlobalValue(EVESpai, 'stationspinner_connect_timeout',
+                         registry.PositiveInteger(10, 'Seconds to wait for \
+                         the stationspinner database to accept a connection'))
+conf.registerGlobalValue(EVESpai, 'sde_pool_min',
+                         registry.NonNegativeInteger(1, 'Connections opened \
+                         when the sde pool is created'))
+conf.registerGlobalValue(EVESpai, 'sde_pool_max',
+                         registry.PositiveInteger(20, 'Maximum number of \
+                         sde connections'))
+conf.registerGlobalValue(EVESpai, 'sde_connect_timeout',
+                         registry.PositiveInteger(10, 'Seconds to wait for \
+                         the sde database to accept a connection'))
+conf.registerGlobalValue(EVESpai, 'keepalives_idle',
+                         registry.PositiveInteger(60, 'Seconds of idle before \
+                         TCP keepalives are sent on database connections'))
+conf.registerGlobalValue(EVESpai, 'keepalives_interval',
+                         registry.PositiveInteger(10, 'Seconds between TCP \
+                         keepalives on database connections'))
+conf.registerGlobalValue(EVESpai, 'keepalives_count',
+                         registry.PositiveInteger(5, 'Unanswered TCP \
+                         keepalives before a database connection is dropped'))
+conf.registerGlobalValue(EVESpai, 'pool_idle_check',
+                         registry.PositiveInteger(60, 'Seconds a database \
+                         connection may sit idle before it is checked with a \
+                         ping on checkout'))
+conf.registerGlobalValue(EVESpai, 'pool_max_backoff',
+                         registry.PositiveInteger(300, 'Maximum seconds to \
+                         wait between attempts to reach a database that is \
+                         down'))
+conf.registerGlobalValue(EVESpai, 'stationspinner_replicas',
+                         registry.SpaceSeparatedListOfStrings([], 'Read \
+                         replicas of the stationspinner database as \
+                         host[:port]'))
+conf.registerGlobalValue(EVESpai, 'sde_replicas',
+                         registry.SpaceSeparatedListOfStrings([], 'Read \
+                         replicas of the sde database as host[:port]'))
+conf.registerGlobalValue(EVESpai, 'max_replica_lag',
+                         registry.PositiveInteger(30, 'Seconds a read replica \
+                         may lag behind before queries go to the primary'))
+conf.registerGlobalValue(EVESpai, 'replica_lag_check',
+                         registry.PositiveInteger(10, 'Seconds between \
+                         replication lag checks of each read replica'))
+conf.registerGlobalValue(EVESpai, 'max_checkout_time',
+                         registry.PositiveInteger(300, 'Seconds a command \
+                         may hold a database connection before it is \
+                         reclaimed'))
+conf.registerGlobalValue(EVESpai, 'stream_batch_size',
+                         registry.PositiveInteger(100, 'Number of rows \
+                         fetched at a time when streaming long listings'))
+conf.registerGlobalValue(EVESpai, 'sde_snapshot',
+                         registry.Boolean(True, 'Load the static data \
+                         export into memory at startup'))
+conf.registerGlobalValue(EVESpai, 'sde_store',
+                         registry.String('', 'Path to a local SDE store \
+                         built with sdestore.py. When set, the sde database \
+                         is not used'))
+conf.registerGlobalValue(EVESpai, 'station_cache_ttl',
+                         registry.PositiveInteger(3600, 'Seconds to cache \
+                         conquerable station names'))
+conf.registerGlobalValue(EVESpai, 'reply_cache_ttl',
+                         registry.PositiveInteger(3600, 'Seconds to keep the \
+                         replies of pos, whereis, whoat, ship and howmany \
+                         when stationspinner has no newer data'))
+conf.registerGlobalValue(EVESpai, 'reply_cache_size',
+                         registry.PositiveInteger(500, 'Maximum number of \
+                         cached command replies'))
+conf.registerGlobalValue(EVESpai, 'large_table_rows',
+                         registry.PositiveInteger(10000, 'Tables with at \
+                         least this many rows are reported by evecheckplans \
+                         when a query scans them sequentially'))
+conf.registerGlobalValue(EVESpai, 'command_workers',
+                         registry.PositiveInteger(10, 'Number of threads \
+                         running database commands. Keep it at most half of \
+                         stationspinner_pool_max, as a command can hold two \
+                         connections at once'))
+conf.registerGlobalValue(EVESpai, 'command_queue_size',
+                         registry.PositiveInteger(50, 'Number of commands \
+                         that may wait for a free thread before the bot \
+                         replies that it is busy'))
+conf.registerGlobalValue(EVESpai, 'max_commands_per_channel',
+                         registry.PositiveInteger(5, 'Number of commands \
+                         from one channel that may be queued or running at \
+                         a time'))
+conf.registerGlobalValue(EVESpai, 'max_commands_per_user',
+                         registry.PositiveInteger(2, 'Number of commands \
+                         from one user that may be queued or running at a \
+                         time'))
+conf.registerGlobalValue(EVESpai, 'api_cache_dir',
+                         registry.String('', 'Directory for cached EVE API \
+                         documents. Defaults to EVESpai/api in the supybot \
+                         data directory'))
+conf.registerGlobalValue(EVESpai, 'api_memory_entries',
+                         registry.PositiveInteger(256, 'Number of parsed \
+                         EVE API documents kept in memory'))
+conf.registerGlobalValue(EVESpai, 'api_memory_bytes',
+                         registry.PositiveInteger(4194304, 'Bytes of XML of \
+                         the parsed EVE API documents kept in memory'))
 conf.registerChannelValue(EVESpai, 'full_access',
                          registry.Boolean(False,
                          'Channels with full access'))
+conf.registerChannelValue(EVESpai, 'command_time_budget',
+                         registry.PositiveInteger(10, 'Seconds a command may \
+                         spend on database queries before it is cut short'))
 conf.registerChannelValue(EVESpai, 'max_lines',
                          registry.Integer(30,
                          'Maxium number of lines to reply with'))
@@ -0,0 +1,752 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Connection pool accounting and prepared statements for the stationspinner
+and sde databases.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errorcodes
+import psycopg2.extensions
+import psycopg2.pool
+
+import rows
+
+_placeholders = re.compile('%%|%s')
+_local = threading.local()
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+@contextmanager
+def budget(seconds):
+    """
+    Give the queries run by this thread inside the block seconds to
+    finish, all together.
+    """
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = time.time() + seconds
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """
+    Return the seconds left of this thread's budget, or None without one.
+    Raises BudgetExceeded once it has run out.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    left = deadline - time.time()
+    if left <= 0:
+        raise BudgetExceeded()
+    return left
+
+
+@contextmanager
+def limited(conn):
+    """
+    Set statement_timeout for the current transaction on conn to the
+    budget left, so the server cancels queries that would overrun it.
+    """
+    left = remaining()
+    if left is not None:
+        cur = conn.cursor()
+        try:
+            cur.execute('SET LOCAL statement_timeout = %s',
+                        [int(left * 1000) + 1])
+        finally:
+            cur.close()
+    try:
+        yield
+    except psycopg2.extensions.QueryCanceledError:
+        if left is None:
+            raise
+        raise BudgetExceeded()
+
+
+class Connection(psycopg2.extensions.connection):
+    """
+    A connection remembering which statements were prepared on it. Pools
+    create these through connection_factory, so a connection replaced by
+    the pool starts out with nothing prepared. Its cursors are Cursors.
+    """
+    def __init__(self, *args, **kwargs):
+        super(Connection, self).__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = Cursor
+
+
+class Cursor(psycopg2.extensions.cursor):
+    """
+    A cursor returning rows.Row tuples, readable by position and by
+    column name. Iterating a server-side cursor stops with BudgetExceeded
+    once the thread's time budget has run out.
+    """
+    def execute(self, *args, **kwargs):
+        self._row = None
+        return super(Cursor, self).execute(*args, **kwargs)
+
+    def _make(self, values):
+        if values is None:
+            return None
+        if getattr(self, '_row', None) is None:
+            self._row = rows.row_type(d[0] for d in self.description)
+        return self._row(values)
+
+    def fetchone(self):
+        return self._make(super(Cursor, self).fetchone())
+
+    def fetchmany(self, *args, **kwargs):
+        return [self._make(values) for values in
+                super(Cursor, self).fetchmany(*args, **kwargs)]
+
+    def fetchall(self):
+        return [self._make(values) for values in
+                super(Cursor, self).fetchall()]
+
+    def __iter__(self):
+        # psycopg2's __iter__ returns the cursor itself, so looping over it
+        # would end up here again; next() on it is psycopg2's own.
+        it = super(Cursor, self).__iter__()
+        while True:
+            try:
+                values = next(it)
+            except StopIteration:
+                return
+            if self.name:
+                remaining()
+            yield self._make(values)
+
+
+class Statement(object):
+    """
+    A query that is PREPAREd once per connection and EXECUTEd afterwards.
+    sql uses the usual %s placeholders, IN %s must be written = ANY(%s).
+    """
+    def __init__(self, name, sql, database=None):
+        self.name = name
+        self.sql = sql
+        self.database = database
+        sql = sql.strip().rstrip(';')
+        self.executions = 0
+        self.prepares = 0
+        self.last_args = None
+        # Statements are named after their text as well, so a reloaded
+        # plugin with changed SQL does not run into the old definitions.
+        self.server_name = 'evespai_{0}_{1:08x}'.format(
+            name, zlib.crc32(sql) & 0xffffffff)
+        count = [0]
+
+        def number(match):
+            if match.group() == '%%':
+                return '%'
+            count[0] += 1
+            return '${0}'.format(count[0])
+        self.prepare_sql = 'PREPARE {0} AS {1}'.format(
+            self.server_name, _placeholders.sub(number, sql))
+        if count[0]:
+            self.execute_sql = 'EXECUTE {0} ({1})'.format(
+                self.server_name, ', '.join(['%s'] * count[0]))
+        else:
+            self.execute_sql = 'EXECUTE {0}'.format(self.server_name)
+
+    def execute(self, cursor, args):
+        self.executions += 1
+        self.last_args = args
+        prepared = getattr(cursor.connection, 'prepared', None)
+        if prepared is None:
+            cursor.execute(self.sql, args)
+            return
+        if self.server_name not in prepared:
+            self._prepare(cursor, prepared)
+        try:
+            cursor.execute(self.execute_sql, args)
+        except psycopg2.ProgrammingError, e:
+            if e.pgcode != psycopg2.errorcodes.INVALID_SQL_STATEMENT_NAME:
+                raise
+            # the server lost it (DISCARD ALL or similar), start over
+            cursor.connection.rollback()
+            prepared.clear()
+            self._prepare(cursor, prepared)
+            cursor.execute(self.execute_sql, args)
+
+    def _prepare(self, cursor, prepared):
+        cursor.execute(self.prepare_sql)
+        prepared.add(self.server_name)
+        self.prepares += 1
+
+
+class Statements(object):
+    """
+    Registry of the named statements a plugin has run.
+    """
+    def __init__(self):
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, sql, database=None):
+        statement = self._statements.get(name)
+        if statement is None or statement.sql != sql:
+            with self._lock:
+                statement = self._statements[name] = Statement(name, sql,
+                                                               database)
+        return statement
+
+    def __iter__(self):
+        return iter(sorted(self._statements.values(),
+                           key=lambda s: s.name))
+
+    def __str__(self):
+        return 'Prepared statements: {0} statements, {1} prepares, ' \
+            '{2} executions'.format(
+                len(self._statements),
+                sum(s.prepares for s in self._statements.values()),
+                sum(s.executions for s in self._statements.values()))
+
+
+def seq_scans(cursor, statement, min_rows):
+    """
+    EXPLAIN statement with the arguments it last ran with and return
+    (relation, estimated rows) for each sequential scan of a table with
+    at least min_rows rows.
+    """
+    sql = statement.sql.strip().rstrip(';')
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, statement.last_args)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    relations = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', ()))
+        if node['Node Type'] == 'Seq Scan':
+            relations.append(node['Relation Name'])
+    scans = []
+    for relation in sorted(set(relations)):
+        cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                       [relation])
+        row = cursor.fetchone()
+        if row and row[0] >= min_rows:
+            scans.append((relation, row[0]))
+    return scans
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Unavailable(Exception):
+    pass
+
+
+class Pool(object):
+    """
+    A lazily created psycopg2 ThreadedConnectionPool.
+
+    settings() is called whenever the pool is (re)built and returns
+    (minconn, maxconn, connection keyword arguments). Connections are
+    checked out with connection(), which always hands them back, rolled
+    back if a transaction is still open. Callers wait up to wait_timeout
+    seconds, or until their budget runs out, for a free connection
+    instead of failing at once, and
+    connections held for more than max_hold seconds are closed and
+    reclaimed.
+
+    Connections idle for more than idle_check seconds are pinged before
+    use. A dead connection retires the whole pool, since after a server
+    restart all of its idle connections are dead, and a new pool is built
+    on the next checkout. While the server cannot be reached, checkouts
+    fail with Unavailable for an exponentially growing backoff period.
+    """
+    def __init__(self, name, settings, max_hold=None, wait_timeout=30,
+                 idle_check=60, max_backoff=300, log=None):
+        self.name = name
+        self.settings = settings
+        self.maxconn = None
+        self.max_hold = max_hold
+        self.wait_timeout = wait_timeout
+        self.idle_check = idle_check
+        self.max_backoff = max_backoff
+        self.log = log
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.leaked = 0
+        self.rollbacks = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self._pool = None
+        self._held = {}
+        self._last_used = {}
+        self._failures = 0
+        self._retry_at = 0
+        self._opening = False
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        failed = True
+        try:
+            yield conn
+            failed = False
+        finally:
+            self._checkin(conn, failed)
+
+    def _open(self):
+        # must be called with self._cond held. The pool connects with the
+        # lock released, other threads wait for it meanwhile.
+        while self._opening:
+            self._cond.wait(1.0)
+        if self._pool is not None:
+            return self._pool
+        now = time.time()
+        if now < self._retry_at:
+            raise Unavailable('{0} database unavailable, retrying in '
+                              '{1:.0f}s'.format(self.name,
+                                                self._retry_at - now))
+        self._opening = True
+        self._cond.release()
+        pool = error = None
+        try:
+            minconn, maxconn, kwargs = self.settings()
+            try:
+                pool = psycopg2.pool.ThreadedConnectionPool(
+                    minconn, maxconn, connection_factory=Connection, **kwargs)
+            except psycopg2.Error, e:
+                error = e
+        finally:
+            self._cond.acquire()
+            self._opening = False
+            self._cond.notify_all()
+        if error is not None:
+            self._failed(error)
+        self._pool = pool
+        self.maxconn = maxconn
+        return pool
+
+    def _failed(self, e):
+        # must be called with self._cond held
+        self._failures += 1
+        backoff = min(self.max_backoff, 2 ** self._failures)
+        self._retry_at = time.time() + backoff
+        if self.log:
+            self.log.warning('Could not connect to {0} database, retrying in '
+                             '{1}s. "{2}"'.format(self.name, backoff, e))
+        raise Unavailable('Could not connect to {0} database. "{1}"'.format(
+            self.name, e))
+
+    def _retire(self):
+        # must be called with self._cond held. Connections still checked
+        # out from the old pool are closed when they come back.
+        if self._pool is None:
+            return
+        self.reconnects += 1
+        for conn in list(getattr(self._pool, '_pool', ())):
+            self._last_used.pop(id(conn), None)
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+        self._pool = None
+
+    def _checkout(self):
+        started = time.time()
+        for attempt in xrange(2):
+            conn = self._reserve(started)
+            if self._alive(conn):
+                break
+            with self._cond:
+                self._release(conn, close=True)
+                self._retire()
+        else:
+            raise Unavailable('{0} database connection lost'.format(
+                self.name))
+        now = time.time()
+        with self._cond:
+            self.checkouts += 1
+            self.wait_time += now - started
+            self.max_wait = max(self.max_wait, now - started)
+        return conn
+
+    def _reserve(self, started):
+        with self._cond:
+            while True:
+                self._reap()
+                pool = self._open()
+                if len(self._held) < self.maxconn:
+                    break
+                left = started + self.wait_timeout - time.time()
+                if left <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout('No free {0} connection after {1}s'.format(
+                        self.name, self.wait_timeout))
+                # never wait past the budget of the command
+                budget_left = remaining()
+                if budget_left is not None:
+                    left = min(left, budget_left)
+                self._cond.wait(min(left, 1.0))
+            # hold the slot while connecting without the lock
+            slot = object()
+            self._held[id(slot)] = (None, time.time(),
+                                    threading.current_thread().name, pool)
+        try:
+            conn = pool.getconn()
+        except psycopg2.Error, e:
+            with self._cond:
+                self._held.pop(id(slot), None)
+                self._cond.notify()
+                if pool is self._pool:
+                    self._retire()
+                self._failed(e)
+        with self._cond:
+            self._held.pop(id(slot), None)
+            self._failures = 0
+            self._held[id(conn)] = (conn, time.time(),
+                                    threading.current_thread().name, pool)
+        return conn
+
+    def _alive(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.time() - last_used < self.idle_check:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _checkin(self, conn, failed):
+        with self._cond:
+            if id(conn) not in self._held:
+                # reclaimed by _reap while we were using it
+                return
+        close = False
+        try:
+            if conn.closed:
+                close = True
+            elif conn.get_transaction_status() != \
+                    psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+                if failed:
+                    self.rollbacks += 1
+        except psycopg2.Error:
+            close = True
+        with self._cond:
+            self._release(conn, close)
+
+    def _release(self, conn, close):
+        # must be called with self._cond held
+        held = self._held.pop(id(conn), None)
+        if held is None:
+            return
+        pool = held[3]
+        if pool is not self._pool:
+            close = True
+        if close:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.time()
+        try:
+            pool.putconn(conn, close=close)
+        except psycopg2.pool.PoolError:
+            pass
+        self._cond.notify()
+
+    def _reap(self):
+        # must be called with self._cond held
+        if not self.max_hold:
+            return
+        now = time.time()
+        for key, (conn, since, thread, pool) in self._held.items():
+            if conn is None or now - since <= self.max_hold:
+                # still connecting, or in time
+                continue
+            self.leaked += 1
+            if self.log:
+                self.log.warning('Reclaiming {0} connection held by {1} for '
+                                 '{2:.0f}s'.format(self.name, thread,
+                                                   now - since))
+            try:
+                conn.cancel()
+            except Exception:
+                pass
+            self._release(conn, close=True)
+
+    def closeall(self):
+        with self._cond:
+            self._held.clear()
+            self._last_used.clear()
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    def __str__(self):
+        # reads the counters without the lock, which may be held while
+        # another thread waits for a free connection
+        in_use = len(self._held)
+        idle = len(getattr(self._pool, '_pool', ()))
+        if self.checkouts:
+            average = self.wait_time / self.checkouts * 1000
+        else:
+            average = 0.0
+        return ('{0}: {1} in use, {2} idle, {3} checkouts, {4:.1f}ms avg '
+                'wait, {5:.1f}ms max wait, {6} leaked, {7} rolled back, '
+                '{8} timeouts, {9} reconnects').format(
+                    self.name, in_use, idle, self.checkouts, average,
+                    self.max_wait * 1000, self.leaked, self.rollbacks,
+                    self.timeouts, self.reconnects)
+
+
+class Replica(object):
+    """
+    A read replica pool with its health: an exponentially weighted moving
+    average of query latency and the replication lag last measured.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.latency = None
+        self.lag = None
+        self.checked = 0
+        self.checking = False
+        self.healthy = True
+        self.queries = 0
+        self.failures = 0
+
+    def record(self, elapsed, alpha=0.2):
+        self.queries += 1
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += alpha * (elapsed - self.latency)
+
+    def __str__(self):
+        if self.latency is None:
+            latency = '-'
+        else:
+            latency = '{0:.1f}ms'.format(self.latency * 1000)
+        if self.lag is None:
+            lag = '-'
+        else:
+            lag = '{0:.1f}s'.format(self.lag)
+        return '{0} ({1}, {2} avg latency, {3} lag, {4} queries, ' \
+               '{5} failures)'.format(self.pool,
+                                      'up' if self.healthy else 'down',
+                                      latency, lag, self.queries,
+                                      self.failures)
+
+
+class Router(object):
+    """
+    Spreads read-only queries over the read replicas of a database.
+
+    A replica is picked by comparing the average latency of two random
+    healthy replicas. Every lag_check seconds a replica's replication lag
+    is measured before it is used; replicas more than max_lag seconds
+    behind, or that fail to hand out a connection, are skipped until the
+    next check. Without a usable replica, queries go to the primary.
+
+    Lag is the age of the last replayed transaction, or 0 once a replica
+    has replayed all WAL it received, since a replica of a primary that is
+    not being written to would otherwise fall further behind by the second.
+    """
+    LAG_SQL = """
+    SELECT pg_is_in_recovery(),
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                THEN 0
+                ELSE EXTRACT(EPOCH FROM
+                             now() - pg_last_xact_replay_timestamp())
+           END"""
+    # the same before PostgreSQL 10 renamed the xlog functions
+    XLOG_LAG_SQL = """
+    SELECT pg_is_in_recovery(),
+           CASE WHEN pg_last_xlog_receive_location() =
+                     pg_last_xlog_replay_location()
+                THEN 0
+                ELSE EXTRACT(EPOCH FROM
+                             now() - pg_last_xact_replay_timestamp())
+           END"""
+
+    def __init__(self, name, primary, replicas=(), max_lag=30, lag_check=10,
+                 log=None):
+        self.name = name
+        self.primary = primary
+        self.replicas = [Replica(pool) for pool in replicas]
+        self.max_lag = max_lag
+        self.lag_check = lag_check
+        self.log = log
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, record=True):
+        """
+        Check out a connection from a replica, or from the primary if no
+        replica is usable, limited to the thread's time budget. Query
+        latency is tracked unless record is false, as for server-side
+        cursors held open while streaming.
+        """
+        replica, conn = self._checkout()
+        pool = replica.pool if replica else self.primary
+        started = time.time()
+        failed = True
+        try:
+            with limited(conn):
+                yield conn
+            failed = False
+        except psycopg2.extensions.QueryCanceledError:
+            raise
+        except psycopg2.OperationalError:
+            if replica:
+                self._down(replica)
+            raise
+        finally:
+            pool._checkin(conn, failed)
+        if replica and record:
+            with self._lock:
+                replica.record(time.time() - started)
+
+    def _checkout(self):
+        tried = set()
+        while True:
+            replica = self._choose(tried)
+            if replica is None:
+                break
+            tried.add(replica)
+            if not self._check_lag(replica):
+                continue
+            try:
+                return replica, replica.pool._checkout()
+            except (Unavailable, PoolTimeout, psycopg2.Error):
+                self._down(replica)
+        if self.replicas:
+            with self._lock:
+                self.fallbacks += 1
+        return None, self.primary._checkout()
+
+    def _choose(self, tried):
+        now = time.time()
+        with self._lock:
+            candidates = [r for r in self.replicas if r not in tried and
+                          (r.healthy or now - r.checked >= self.lag_check)]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        if a.latency is None or (b.latency is not None and
+                                 a.latency <= b.latency):
+            return a
+        return b
+
+    def _check_lag(self, replica):
+        with self._lock:
+            if replica.checking or \
+                    time.time() - replica.checked < self.lag_check:
+                return replica.healthy
+            replica.checking = True
+        healthy = False
+        lag = None
+        try:
+            with replica.pool.connection() as conn:
+                cur = conn.cursor()
+                if conn.server_version >= 100000:
+                    cur.execute(self.LAG_SQL)
+                else:
+                    cur.execute(self.XLOG_LAG_SQL)
+                in_recovery, lag = cur.fetchone()
+                cur.close()
+            if not in_recovery:
+                # promoted, or not a replica at all
+                lag = 0.0
+            healthy = lag is not None and lag <= self.max_lag
+        except (Unavailable, PoolTimeout, psycopg2.Error), e:
+            if self.log:
+                self.log.warning('{0} replica {1} unavailable. "{2}"'.format(
+                    self.name, replica.pool.name, e))
+        except BudgetExceeded:
+            # says nothing about the replica, let the next command check it
+            with self._lock:
+                replica.checking = False
+            raise
+        with self._lock:
+            if not healthy and replica.healthy:
+                replica.failures += 1
+            replica.lag = lag
+            replica.healthy = healthy
+            replica.checked = time.time()
+            replica.checking = False
+        return healthy
+
+    def _down(self, replica):
+        with self._lock:
+            if replica.healthy:
+                replica.failures += 1
+            replica.healthy = False
+            replica.checked = time.time()
+
+    def closeall(self):
+        self.primary.closeall()
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+    def __str__(self):
+        lines = [str(self.primary)]
+        with self._lock:
+            for replica in self.replicas:
+                lines.append(str(replica))
+        if self.replicas:
+            lines.append('{0}: {1} queries fell back to the primary'.format(
+                self.name, self.fallbacks))
+        return '\n'.join(lines)
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -151,8 +151,12 @@ import httplib
 import urlparse
 import urllib
 import copy
+import socket
+import threading
 import warnings
 
+from array import array
+from itertools import compress, izip
 from xml.parsers import expat
 from time import strptime
 from calendar import timegm
@@ -162,6 +166,7 @@ proxySSL = False
 
 _default_useragent = "eveapi.py/1.3"
 _useragent = None  # use set_user_agent() to set this.
+_columnar_rows = None  # use set_columnar_rows() to set this.
 
 #-----------------------------------------------------------------------------
 
@@ -179,6 +184,14 @@ def set_user_agent(user_agent_string):
 	global _useragent
 	_useragent = user_agent_string
 
+def set_columnar_rows(rows):
+	"""Makes the XML parser return rowsets of at least this many rows as a
+	ColumnarRowset, which stores one typed array per column instead of a
+	list per row. rows may be None to always use plain Rowsets (default).
+	"""
+	global _columnar_rows
+	_columnar_rows = rows
+
 
 class Error(StandardError):
 	def __init__(self, code, message):
@@ -234,6 +247,19 @@ def EVEAPIConnection(url="api.eveonline.com", cacheHandler=None, proxy=None, pro
 	#          will only be called if you returned None in the retrieve() for
 	#          this object.
 	#
+	#      open_store(host, path, params)   (optional)
+	#
+	#          Called instead of store() if the handler has it, before the
+	#          document is read. Must return an object with these methods:
+	#
+	#           write(data) - called with the XML as it arrives
+	#           commit(obj) - the document was parsed into obj, keep it
+	#           abort()     - forget what was written. Also called after
+	#                         commit(), where it must do nothing.
+	#
+	#          This lets eveapi parse the document while it is being
+	#          received instead of reading it into memory first.
+	#
 
 	if not url.startswith("http"):
 		url = "https://" + url
@@ -296,6 +322,95 @@ def _ParseXML(response, fromContext, storeFunc):
 	
 
 
+#-----------------------------------------------------------------------------
+# HTTP connections
+#-----------------------------------------------------------------------------
+
+class _ConnectionPool(object):
+	# Keeps idle keep-alive connections per host, or per proxy, so that
+	# requests do not pay for a TCP and TLS handshake each. Shared by all
+	# API objects and threads.
+
+	def __init__(self, maxidle=4):
+		self.maxidle = maxidle
+		self._idle = {}
+		self._lock = threading.Lock()
+
+	def _connect(self, ctx):
+		if ctx._proxy is None:
+			if ctx._scheme == "https":
+				return httplib.HTTPSConnection(ctx._host)
+			return httplib.HTTPConnection(ctx._host)
+		if ctx._proxySSL:
+			return httplib.HTTPSConnection(*ctx._proxy)
+		return httplib.HTTPConnection(*ctx._proxy)
+
+	def request(self, ctx, args):
+		# Sends the request and returns the response and a function to call
+		# once done with it. The connection goes back to the pool if the
+		# body was read to the end, otherwise it is closed. A reused
+		# connection the server has closed in the meantime is replaced by a
+		# new one and the request is retried.
+		key = (ctx._scheme, ctx._host, ctx._proxy, ctx._proxySSL)
+		while True:
+			with self._lock:
+				idle = self._idle.get(key)
+				conn = idle.pop() if idle else None
+			reused = conn is not None
+			if not reused:
+				conn = self._connect(ctx)
+			try:
+				conn.request(*args)
+				response = conn.getresponse()
+			except (httplib.HTTPException, socket.error):
+				conn.close()
+				if reused:
+					continue
+				raise
+			break
+
+		def release():
+			if response.isclosed() and not response.will_close:
+				self._release(key, conn)
+			else:
+				conn.close()
+		return response, release
+
+	def _release(self, key, conn):
+		with self._lock:
+			idle = self._idle.setdefault(key, [])
+			if len(idle) < self.maxidle:
+				idle.append(conn)
+				return
+		conn.close()
+
+	def closeall(self):
+		with self._lock:
+			idle, self._idle = self._idle, {}
+		for conns in idle.itervalues():
+			for conn in conns:
+				conn.close()
+
+_connections = _ConnectionPool()
+
+
+class _Tee(object):
+	# File-like object that passes everything read from stream on to the
+	# write() method of sink.
+
+	def __init__(self, stream, sink):
+		self.stream = stream
+		self.sink = sink
+
+	def read(self, size=-1):
+		if size < 0:
+			data = self.stream.read()
+		else:
+			data = self.stream.read(size)
+		self.sink.write(data)
+		return data
+
+
 #-----------------------------------------------------------------------------
 # API Classes
 #-----------------------------------------------------------------------------
@@ -389,24 +504,18 @@ class _RootContext(_Context):
 
 			if self._proxy is None:
 				req = path
-				if self._scheme == "https":
-					conn = httplib.HTTPSConnection(self._host)
-				else:
-					conn = httplib.HTTPConnection(self._host)
 			else:
 				req = self._scheme+'://'+self._host+path
-				if self._proxySSL:
-					conn = httplib.HTTPSConnection(*self._proxy)
-				else:
-					conn = httplib.HTTPConnection(*self._proxy)
 
 			if kw:
-				conn.request("POST", req, urllib.urlencode(kw), {"Content-type": "application/x-www-form-urlencoded", "User-Agent": _useragent or _default_useragent})
+				args = ("POST", req, urllib.urlencode(kw), {"Content-type": "application/x-www-form-urlencoded", "User-Agent": _useragent or _default_useragent})
 			else:
-				conn.request("GET", req, "", {"User-Agent": _useragent or _default_useragent})
+				args = ("GET", req, "", {"User-Agent": _useragent or _default_useragent})
 
-			response = conn.getresponse()
+			response, release = _connections.request(self, args)
 			if response.status != 200:
+				response.read()
+				release()
 				if response.status == httplib.NOT_FOUND:
 					raise AttributeError("'%s' not available on API server (404 Not Found)" % path)
 				elif response.status == httplib.FORBIDDEN:
@@ -414,27 +523,42 @@ class _RootContext(_Context):
 				else:
 					raise ServerError(response.status, "'%s' request failed (%s)" % (path, response.reason))
 
-			if cache:
-				store = True
+			sink = None
+			open_store = cache and getattr(cache, "open_store", None)
+			if open_store:
+				# tee mode: parse the document as it arrives while the
+				# handler writes the same bytes away
+				sink = open_store(self._host, path, kw)
+				response = _Tee(response, sink)
+				storeFunc = sink.commit
+			elif cache:
 				response = response.read()
+				storeFunc = lambda obj: cache.store(self._host, path, kw, response, obj)
 			else:
-				store = False
+				storeFunc = None
 		else:
-			store = False
+			release = sink = storeFunc = None
 
-		retrieve_fallback = cache and getattr(cache, "retrieve_fallback", False)
-		if retrieve_fallback:
-			# implementor is handling fallbacks...
-			try:
-				return _ParseXML(response, True, store and (lambda obj: cache.store(self._host, path, kw, response, obj)))
-			except Error, e:
-				response = retrieve_fallback(self._host, path, kw, reason=e)
-				if response is not None:
-					return response
-				raise
-		else:
-			# implementor is not handling fallbacks...
-			return _ParseXML(response, True, store and (lambda obj: cache.store(self._host, path, kw, response, obj)))
+		try:
+			retrieve_fallback = cache and getattr(cache, "retrieve_fallback", False)
+			if retrieve_fallback:
+				# implementor is handling fallbacks...
+				try:
+					return _ParseXML(response, True, storeFunc)
+				except Error, e:
+					response = retrieve_fallback(self._host, path, kw, reason=e)
+					if response is not None:
+						return response
+					raise
+			else:
+				# implementor is not handling fallbacks...
+				return _ParseXML(response, True, storeFunc)
+		finally:
+			if sink:
+				# does nothing if the document was stored
+				sink.abort()
+			if release:
+				release()
 
 #-----------------------------------------------------------------------------
 # XML Parser
@@ -605,7 +729,7 @@ class _Parser(object):
 			_row = parent._rows[-1]
 			_row.append(data)
 			if len(parent._cols) < len(_row):
-				parent._cols.append("data")
+				parent._addcol("data")
 
 		elif this._attributes:
 			# this tag has attributes, so we can't simply assign the cdata
@@ -632,12 +756,17 @@ class _Parser(object):
 		self.container = this.__parent
 		del this.__parent
 
-		attributes = this.__dict__.pop("_attributes")
-		attributes2 = this.__dict__.pop("_attributes2")
+		attributes = this._attributes
+		attributes2 = this._attributes2
+		del this._attributes, this._attributes2
 		if attributes is None:
 			# already processed this tag's closure early, in tag_start()
 			return
 
+		if _columnar_rows is not None and type(this) in (Rowset, IndexRowset) and len(this) >= _columnar_rows:
+			# all rows are in, store this big rowset column-wise instead.
+			this = _columnar(this)
+
 		if self.container._isrow:
 			# Special case here. tags inside a row! Such tags have to be
 			# added as attributes of the row.
@@ -651,7 +780,7 @@ class _Parser(object):
 
 			# fix columns if neccessary.
 			if len(parent._cols) < len(_row):
-				parent._cols.append(this._name)
+				parent._addcol(this._name)
 		else:
 			# see if there's already an attribute with this name (this shouldn't
 			# really happen, but it doesn't hurt to handle this case!
@@ -716,10 +845,38 @@ class _Parser(object):
 #-----------------------------------------------------------------------------
 
 class Element(object):
-	# Element is a namespace for attributes and nested tags
+	# Element is a namespace for attributes and nested tags. The attributes
+	# the parser uses itself have slots, the tags go in __dict__.
+	__slots__ = ("__dict__", "_name", "_isrow", "_attributes", "_attributes2", "_Parser__parent")
+
 	def __str__(self):
 		return "<Element '%s'>" % self._name
 
+	def __getstate__(self):
+		slots = {}
+		for name in Element.__slots__[1:]:
+			if hasattr(self, name):
+				slots[name] = getattr(self, name)
+		return (self.__dict__, slots)
+
+	def __setstate__(self, state):
+		if isinstance(state, dict):
+			# pickled before Element had slots, state is its __dict__
+			attributes, slots = {}, state
+		else:
+			attributes, slots = state
+		self.__dict__.update(attributes)
+		for name, value in slots.iteritems():
+			setattr(self, name, value)
+
+
+def _colmap(cols):
+	# maps each column name to the position of its first occurrence
+	colmap = {}
+	for i, col in enumerate(cols):
+		colmap.setdefault(col, i)
+	return colmap
+
 _fmt = u"%s:%s".__mod__
 class Row(object):
 	# A Row is a single database record associated with a Rowset.
@@ -727,11 +884,17 @@ class Row(object):
 	# column name.
 	#
 	# To conserve resources, Row objects are only created on-demand. This is
-	# typically done by Rowsets (e.g. when iterating over the rowset).
-	
-	def __init__(self, cols=None, row=None):
+	# typically done by Rowsets (e.g. when iterating over the rowset), which
+	# share their column name -> position map with all of their rows.
+
+	__slots__ = ("_cols", "_row", "_map")
+
+	def __init__(self, cols=None, row=None, colmap=None):
 		self._cols = cols or []
 		self._row = row or []
+		if colmap is None:
+			colmap = _colmap(self._cols)
+		self._map = colmap
 
 	def __nonzero__(self):
 		return True
@@ -748,29 +911,42 @@ class Row(object):
 		return cmp(self._cols, other._cols) or cmp(self._row, other._row)
 
 	def __hasattr__(self, this):
-		if this in self._cols:
-			return self._cols.index(this) < len(self._row)
-		return False
+		i = self._map.get(this)
+		return i is not None and i < len(self._row)
 
 	__contains__ = __hasattr__
 
 	def get(self, this, default=None):
-		if (this in self._cols) and (self._cols.index(this) < len(self._row)):
-			return self._row[self._cols.index(this)]
+		i = self._map.get(this)
+		if i is not None and i < len(self._row):
+			return self._row[i]
 		return default
 
 	def __getattr__(self, this):
+		if this in Row.__slots__:
+			# not set yet, e.g. while unpickling
+			raise AttributeError, this
 		try:
-			return self._row[self._cols.index(this)]
-		except:
+			return self._row[self._map[this]]
+		except (KeyError, IndexError):
 			raise AttributeError, this
 
 	def __getitem__(self, this):
-		return self._row[self._cols.index(this)]
+		return self._row[self._map[this]]
 
 	def __str__(self):
 		return "Row(" + ','.join(map(_fmt, zip(self._cols, self._row))) + ")"
 
+	def __getstate__(self):
+		return (self._cols, self._row)
+
+	def __setstate__(self, state):
+		if isinstance(state, dict):
+			# pickled before Row had slots, state is its __dict__
+			state = (state["_cols"], state["_row"])
+		self._cols, self._row = state
+		self._map = _colmap(self._cols)
+
 
 class Rowset(object):
 	# Rowsets are collections of Row objects.
@@ -802,6 +978,18 @@ class Rowset(object):
 	#     provided instead of the values tuple.
 	#     When row=True, each result will be decorated with the entire row.
 	#
+	#   Filter(column, test)
+	#     Returns a new rowset with the rows for which test(value of column)
+	#     is true.
+	#
+	#   Sum(column, by=None)
+	#     Returns the sum of the values in column. If by is given, returns a
+	#     dict mapping each value of column by to the sum for those rows.
+	#
+	#   Count(by=None)
+	#     Returns the number of rows. If by is given, returns a dict mapping
+	#     each value of column by to the number of rows having it.
+	#
 
 	def IndexedBy(self, column):
 		return IndexRowset(self._cols, self._rows, column)
@@ -810,7 +998,7 @@ class Rowset(object):
 		return FilterRowset(self._cols, self._rows, column)
 
 	def SortBy(self, column, reverse=False):
-		ix = self._cols.index(column)
+		ix = self._colmap[column]
 		self.sort(key=lambda e: e[ix], reverse=reverse)
 
 	def SortedBy(self, column, reverse=False):
@@ -819,8 +1007,9 @@ class Rowset(object):
 		return rs
 
 	def Select(self, *columns, **options):
+		colmap = self._colmap
 		if len(columns) == 1:
-			i = self._cols.index(columns[0])
+			i = colmap[columns[0]]
 			if options.get("row", False):
 				for line in self._rows:
 					yield (line, line[i])
@@ -828,7 +1017,7 @@ class Rowset(object):
 				for line in self._rows:
 					yield line[i]
 		else:
-			i = map(self._cols.index, columns)
+			i = [colmap[column] for column in columns]
 			if options.get("row", False):
 				for line in self._rows:
 					yield line, [line[x] for x in i]
@@ -836,6 +1025,26 @@ class Rowset(object):
 				for line in self._rows:
 					yield [line[x] for x in i]
 
+	def Filter(self, column, test):
+		i = self._colmap[column]
+		return Rowset(self._cols, [line for line in self._rows if test(line[i])])
+
+	def Sum(self, column, by=None):
+		if by is None:
+			return sum(self.Select(column))
+		totals = {}
+		for key, value in self.Select(by, column):
+			totals[key] = totals.get(key, 0) + value
+		return totals
+
+	def Count(self, by=None):
+		if by is None:
+			return len(self)
+		counts = {}
+		for key in self.Select(by):
+			counts[key] = counts.get(key, 0) + 1
+		return counts
+
 
 	# -------------
 
@@ -843,6 +1052,26 @@ class Rowset(object):
 		self._cols = cols or []
 		self._rows = rows or []
 
+	def _getcols(self):
+		return self.__cols
+
+	def _setcols(self, cols):
+		self.__cols = cols
+		self.__colmap = None
+
+	_cols = property(_getcols, _setcols)
+
+	def _addcol(self, name):
+		self.__cols.append(name)
+		self.__colmap = None
+
+	@property
+	def _colmap(self):
+		# column name -> position, shared by the rows handed out
+		if self.__colmap is None:
+			self.__colmap = _colmap(self.__cols)
+		return self.__colmap
+
 	def append(self, row):
 		if isinstance(row, list):
 			self._rows.append(row)
@@ -869,7 +1098,13 @@ class Rowset(object):
 	def __getitem__(self, ix):
 		if type(ix) is slice:
 			return Rowset(self._cols, self._rows[ix])
-		return Row(self._cols, self._rows[ix])
+		return Row(self._cols, self._rows[ix], self._colmap)
+
+	def __iter__(self):
+		cols = self._cols
+		colmap = self._colmap
+		for row in self._rows:
+			yield Row(cols, row, colmap)
 
 	def sort(self, *args, **kw):
 		self._rows.sort(*args, **kw)
@@ -902,7 +1137,7 @@ class IndexRowset(Rowset):
 			if default:
 				return default[0]
 			raise KeyError, key
-		return Row(self._cols, row)
+		return Row(self._cols, row, self._colmap)
 
 	# -------------
 
@@ -945,6 +1180,256 @@ class IndexRowset(Rowset):
 		Rowset.__setstate__(self, state)
 
 
+def _pack(values):
+	# Stores one column in the most compact way that returns the values
+	# unchanged: an array for ints or floats, otherwise a list in which
+	# equal strings share one object.
+	kinds = set(map(type, values))
+	if kinds == _INT:
+		try:
+			return array("l", values)
+		except OverflowError:
+			pass
+	elif kinds == _FLOAT:
+		return array("d", values)
+	elif kinds <= _TEXT:
+		seen = {}
+		return [seen.setdefault(value, value) for value in values]
+	return list(values)
+
+_INT = set([int])
+_FLOAT = set([float])
+_TEXT = set([str, unicode, type(None)])
+
+def _take(column, order):
+	values = map(column.__getitem__, order)
+	if type(column) is array:
+		return array(column.typecode, values)
+	return values
+
+
+class ColumnarRowset(Rowset):
+	# A ColumnarRowset holds the same data as a Rowset but stores it as one
+	# array per column of ints or floats, or a list for everything else.
+	# Select, Filter, Sum, Count, SortBy and SortedBy work on the columns
+	# directly. Indexing and iteration build Row objects as usual, and _rows
+	# builds the per-row lists on demand for everything else.
+	#
+	# Pickles have the same (columns, rows) state as a Rowset.
+
+	def __init__(self, cols=None, rows=None):
+		self._cols = cols or []
+		self._pack(rows or [])
+
+	def _pack(self, rows):
+		width = len(self._cols)
+		self._len = len(rows)
+		self._columns = [_pack([row[i] if i < len(row) else None for row in rows]) for i in xrange(width)]
+
+	def _slice(self, columns, length):
+		rs = ColumnarRowset(self._cols)
+		rs._columns = columns
+		rs._len = length
+		return rs
+
+	@property
+	def _rows(self):
+		return map(list, izip(*self._columns)) if self._columns else [[] for i in xrange(self._len)]
+
+	def _addcol(self, name):
+		Rowset._addcol(self, name)
+		self._columns.append([None] * self._len)
+
+	def _line(self, ix):
+		return [column[ix] for column in self._columns]
+
+	def SortBy(self, column, reverse=False):
+		key = self._columns[self._colmap[column]]
+		order = sorted(xrange(self._len), key=key.__getitem__, reverse=reverse)
+		self._columns = [_take(c, order) for c in self._columns]
+
+	def Select(self, *columns, **options):
+		colmap = self._colmap
+		if len(columns) == 1:
+			column = self._columns[colmap[columns[0]]]
+			if options.get("row", False):
+				for ix, value in enumerate(column):
+					yield (self._line(ix), value)
+			else:
+				for value in column:
+					yield value
+		else:
+			selected = [self._columns[colmap[column]] for column in columns]
+			if options.get("row", False):
+				for ix, values in enumerate(izip(*selected)):
+					yield self._line(ix), list(values)
+			else:
+				for values in izip(*selected):
+					yield list(values)
+
+	def Filter(self, column, test):
+		order = list(compress(xrange(self._len), map(test, self._columns[self._colmap[column]])))
+		# like Rowset.Filter, the result has no index even if this has one
+		return ColumnarRowset._slice(self, [_take(c, order) for c in self._columns], len(order))
+
+	def Sum(self, column, by=None):
+		values = self._columns[self._colmap[column]]
+		if by is None:
+			return sum(values)
+		totals = {}
+		for key, value in izip(self._columns[self._colmap[by]], values):
+			totals[key] = totals.get(key, 0) + value
+		return totals
+
+	def Count(self, by=None):
+		if by is None:
+			return self._len
+		counts = {}
+		for key in self._columns[self._colmap[by]]:
+			counts[key] = counts.get(key, 0) + 1
+		return counts
+
+	def append(self, row):
+		if isinstance(row, Row) and len(row._cols) == len(self._cols):
+			row = row._row
+		elif not isinstance(row, list):
+			raise TypeError("incompatible row type")
+		columns = self._columns
+		for i, column in enumerate(columns):
+			value = row[i] if i < len(row) else None
+			if type(column) is array:
+				try:
+					if type(value) is (float if column.typecode == "d" else int):
+						column.append(value)
+						continue
+				except OverflowError:
+					pass
+				columns[i] = column = list(column)
+			column.append(value)
+		self._len += 1
+
+	def __nonzero__(self):
+		return self._len > 0
+
+	def __len__(self):
+		return self._len
+
+	def __getitem__(self, ix):
+		if type(ix) is slice:
+			return self._slice([c[ix] for c in self._columns], len(xrange(*ix.indices(self._len))))
+		if not -self._len <= ix < self._len:
+			raise IndexError("rowset index out of range")
+		return Row(self._cols, self._line(ix), self._colmap)
+
+	def __iter__(self):
+		cols = self._cols
+		colmap = self._colmap
+		for values in izip(*self._columns):
+			yield Row(cols, list(values), colmap)
+
+	def sort(self, *args, **kw):
+		rows = self._rows
+		rows.sort(*args, **kw)
+		self._pack(rows)
+
+	def __getstate__(self):
+		return (self._cols, self._rows)
+
+	def __setstate__(self, state):
+		self._cols, rows = state
+		self._pack(rows)
+
+
+class ColumnarIndexRowset(ColumnarRowset, IndexRowset):
+	# The columnar form of an IndexRowset. Its index maps each key to the
+	# position of the row, and is rebuilt when the rows are reordered.
+
+	def Get(self, key, *default):
+		ix = self._items.get(key, None)
+		if ix is None:
+			if default:
+				return default[0]
+			raise KeyError, key
+		return Row(self._cols, self._line(ix), self._colmap)
+
+	# -------------
+
+	def __init__(self, cols=None, rows=None, key=None):
+		ColumnarRowset.__init__(self, cols, rows)
+		try:
+			if "," in key:
+				self._ki = [self._cols.index(k) for k in key.split(",")]
+				self.composite = True
+			else:
+				self._ki = self._cols.index(key)
+				self.composite = False
+		except ValueError:
+			raise ValueError("Rowset has no column %s" % key)
+		self._key = key
+		self._reindex()
+
+	def _keys(self):
+		if self.composite:
+			return izip(*[self._columns[k] for k in self._ki])
+		return self._columns[self._ki]
+
+	def _reindex(self):
+		self._items = dict(izip(self._keys(), xrange(self._len)))
+
+	def _slice(self, columns, length):
+		rs = ColumnarIndexRowset(self._cols, None, self._key)
+		rs._columns = columns
+		rs._len = length
+		rs._reindex()
+		return rs
+
+	def SortBy(self, column, reverse=False):
+		ColumnarRowset.SortBy(self, column, reverse)
+		self._reindex()
+
+	def sort(self, *args, **kw):
+		ColumnarRowset.sort(self, *args, **kw)
+		self._reindex()
+
+	def append(self, row):
+		ColumnarRowset.append(self, row)
+		ix = self._len - 1
+		if self.composite:
+			self._items[tuple([self._columns[k][ix] for k in self._ki])] = ix
+		else:
+			self._items[self._columns[self._ki][ix]] = ix
+
+	def __getstate__(self):
+		rows = self._rows
+		items = dict((key, rows[ix]) for key, ix in self._items.iteritems())
+		return ((self._cols, rows), items, self._ki)
+
+	def __setstate__(self, state):
+		state, items, self._ki = state
+		ColumnarRowset.__setstate__(self, state)
+		self.composite = type(self._ki) is list
+		if self.composite:
+			self._key = ",".join([self._cols[k] for k in self._ki])
+		else:
+			self._key = self._cols[self._ki]
+		self._reindex()
+
+
+def _columnar(rowset):
+	# used by the parser on a finished rowset
+	try:
+		if isinstance(rowset, IndexRowset):
+			columnar = ColumnarIndexRowset(rowset._cols, rowset._rows, rowset._key)
+		else:
+			columnar = ColumnarRowset(rowset._cols, rowset._rows)
+	except ValueError:
+		# the key column went missing while fixing up the columns
+		return rowset
+	columnar._name = rowset._name
+	columnar._isrow = rowset._isrow
+	return columnar
+
+
 class FilterRowset(object):
 	# A FilterRowset works much like an IndexRowset, with the following
 	# differences:
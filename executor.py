@@ -0,0 +1,167 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+A bounded pool of worker threads for commands that wait on the databases.
+"""
+
+import Queue
+import threading
+import time
+
+
+class Busy(Exception):
+    pass
+
+
+class Executor(object):
+    """
+    Runs calls on a fixed number of worker threads. Calls wait in a queue
+    of at most queue_size entries, and every channel and user may only
+    have per_channel and per_user calls queued or running at a time.
+    Calls submitted with channel None only count against the user.
+    submit() raises Busy instead of queueing beyond these limits, and
+    after shutdown().
+    """
+    def __init__(self, name, workers, queue_size, per_channel, per_user,
+                 log=None):
+        self.name = name
+        self.per_channel = per_channel
+        self.per_user = per_user
+        self.log = log
+        self.submitted = 0
+        self.rejected = 0
+        self.started = 0
+        self.completed = 0
+        self.running = 0
+        self.max_depth = 0
+        self.wait_time = 0.0
+        self._queue = Queue.Queue(queue_size)
+        self._active = {}
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._threads = []
+        for i in xrange(workers):
+            thread = threading.Thread(target=self._work,
+                                      name='{0} worker {1}'.format(name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, channel, user, f, *args):
+        keys = (('user', user, self.per_user),)
+        if channel is not None:
+            keys += (('channel', channel, self.per_channel),)
+        with self._lock:
+            if self._stopping:
+                self.rejected += 1
+                raise Busy('Shutting down')
+            for key in keys:
+                if self._active.get(key[:2], 0) >= key[2]:
+                    self.rejected += 1
+                    raise Busy('Too many commands from this {0}'.format(
+                        key[0]))
+            try:
+                self._queue.put_nowait((time.time(), keys, f, args))
+            except Queue.Full:
+                self.rejected += 1
+                raise Busy('Too many commands queued')
+            for key in keys:
+                self._active[key[:2]] = self._active.get(key[:2], 0) + 1
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                # pass the stop on to the next worker
+                self._queue.put_nowait(None)
+                return
+            queued, keys, f, args = item
+            with self._lock:
+                self.running += 1
+                self.started += 1
+                self.wait_time += time.time() - queued
+            try:
+                f(*args)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except BaseException:
+                # nothing a call raises may end the worker
+                if self.log:
+                    self.log.exception('Uncaught exception in {0}'.format(
+                        self.name))
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self._release(keys)
+
+    def _release(self, keys):
+        # must be called with self._lock held
+        for key in keys:
+            count = self._active[key[:2]] - 1
+            if count:
+                self._active[key[:2]] = count
+            else:
+                del self._active[key[:2]]
+
+    def shutdown(self):
+        """
+        Stop the workers once their current calls return. Calls still
+        queued are dropped, and nothing waits for a full queue.
+        """
+        with self._lock:
+            self._stopping = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if item is not None:
+                    self._release(item[1])
+            self._queue.put_nowait(None)
+
+    def __str__(self):
+        with self._lock:
+            if self.started:
+                average = self.wait_time / self.started * 1000
+            else:
+                average = 0.0
+            return ('{0}: {1} workers, {2} running, {3} queued, {4} max '
+                    'queued, {5} submitted, {6} rejected, {7:.1f}ms avg '
+                    'wait').format(self.name, len(self._threads),
+                                   self.running, self._queue.qsize(),
+                                   self.max_depth, self.submitted,
+                                   self.rejected, average)
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,273 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Case-insensitive name indexes answering ILIKE patterns from memory.
+
+All names of an index are folded and joined into one newline separated
+string, in the order they were given. Exact lookups go through a dict,
+prefix, suffix and substring patterns through str.find and anything else
+through a regular expression over the joined string. The first match is
+therefore the first name in insertion order, which for tables loaded in
+ID order is what the SDE server returns for the same ILIKE.
+"""
+
+import heapq
+import re
+from array import array
+from bisect import bisect_right
+
+EXACT, PREFIX, SUFFIX, SUBSTRING, PATTERN = range(5)
+
+# Trigram similarity below which names are not worth suggesting, the score
+# a suggestion needs to be picked without asking and how far ahead of the
+# runner-up it has to be.
+MIN_SIMILARITY = 0.2
+CLEAR_WINNER = 0.4
+CLEAR_MARGIN = 0.15
+
+
+def fold(name):
+    if isinstance(name, str):
+        name = name.decode('utf-8', 'replace')
+    return name.lower()
+
+
+def parse_like(pattern):
+    """
+    Split an ILIKE pattern into (kind, folded text). For PATTERN the text is
+    a regular expression matching a single name.
+    """
+    tokens = []
+    chars = iter(fold(pattern))
+    for c in chars:
+        if c == u'\\':
+            tokens.append(next(chars, u'\\'))
+        elif c in u'%_':
+            tokens.append(None if c == u'%' else False)
+        else:
+            tokens.append(c)
+
+    leading = 0
+    while leading < len(tokens) and tokens[leading] is None:
+        leading += 1
+    trailing = 0
+    while trailing < len(tokens) - leading and tokens[-1 - trailing] is None:
+        trailing += 1
+    middle = tokens[leading:len(tokens) - trailing]
+
+    if all(isinstance(t, unicode) for t in middle):
+        text = u''.join(middle)
+        if leading and trailing or (leading or trailing) and not text:
+            return SUBSTRING, text
+        elif leading:
+            return SUFFIX, text
+        elif trailing:
+            return PREFIX, text
+        return EXACT, text
+
+    regex = []
+    for t in tokens:
+        if t is None:
+            regex.append(u'[^\n]*')
+        elif t is False:
+            regex.append(u'[^\n]')
+        else:
+            regex.append(re.escape(t))
+    return PATTERN, u'^{0}$'.format(u''.join(regex))
+
+
+class NameIndex(object):
+    """
+    Maps ILIKE patterns to the keys of the names matching them.
+    """
+    def __init__(self, items):
+        self._keys = []
+        self._offsets = array('l')
+        self._exact = {}
+        names = []
+        offset = 1
+        for key, name in items:
+            folded = fold(name or u'')
+            if u'\n' in folded:
+                continue
+            self._exact.setdefault(folded, key)
+            self._keys.append(key)
+            self._offsets.append(offset)
+            names.append(folded)
+            offset += len(folded) + 1
+        self._names = u'\n{0}\n'.format(u'\n'.join(names))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _key_at(self, position):
+        return self._keys[bisect_right(self._offsets, position) - 1]
+
+    def _positions(self, kind, text):
+        # Yields one match position inside every matching name, in order.
+        if kind == EXACT:
+            kind, text = PATTERN, u'^{0}$'.format(re.escape(text))
+        if kind == PATTERN:
+            for match in re.finditer(text, self._names, re.M):
+                if 0 < match.start() < len(self._names):
+                    yield match.start()
+            return
+        if not text:
+            for offset in self._offsets:
+                yield offset
+            return
+        if kind == PREFIX:
+            needle, shift = u'\n' + text, 1
+        elif kind == SUFFIX:
+            needle, shift = text + u'\n', 0
+        else:
+            needle, shift = text, 0
+        start = 0
+        while True:
+            position = self._names.find(needle, start)
+            if position < 0:
+                return
+            position += shift
+            yield position
+            # continue with the next name, keeping the newline in front of
+            # it for prefix searches.
+            start = self._names.find(u'\n', position + len(text)) + 1 - shift
+
+    def match(self, pattern):
+        """
+        Return the key of the first name matching pattern, or None.
+        """
+        kind, text = parse_like(pattern)
+        if kind == EXACT:
+            return self._exact.get(text)
+        for position in self._positions(kind, text):
+            return self._key_at(position)
+        return None
+
+    def match_all(self, pattern):
+        """
+        Return the keys of all names matching pattern, in index order.
+        """
+        kind, text = parse_like(pattern)
+        return [self._key_at(p) for p in self._positions(kind, text)]
+
+    def exact(self, name):
+        return self._exact.get(fold(name))
+
+    def prefix(self, text):
+        for position in self._positions(PREFIX, fold(text)):
+            return self._key_at(position)
+
+    def substring(self, text):
+        for position in self._positions(SUBSTRING, fold(text)):
+            return self._key_at(position)
+
+
+_words = re.compile(r'\w+', re.U)
+
+
+def trigrams(name):
+    """
+    The trigrams of name as pg_trgm computes them: every word is folded and
+    padded with two spaces in front and one behind.
+    """
+    grams = set()
+    for word in _words.findall(fold(name)):
+        word = u'  {0} '.format(word)
+        for i in xrange(len(word) - 2):
+            grams.add(word[i:i + 3])
+    return grams
+
+
+def clear_winner(matches):
+    """
+    True if the first of the (key, name, similarity) matches returned by
+    TrigramIndex.search stands out enough to be used without asking.
+    """
+    if not matches or matches[0][2] < CLEAR_WINNER:
+        return False
+    return len(matches) == 1 or matches[0][2] - matches[1][2] >= CLEAR_MARGIN
+
+
+class TrigramIndex(object):
+    """
+    Finds the names most similar to a misspelt one, scoring them like
+    pg_trgm's similarity(): shared trigrams over all distinct trigrams.
+    """
+    def __init__(self, items):
+        self._keys = []
+        self._names = []
+        self._sizes = array('H')
+        self._postings = {}
+        for key, name in items:
+            grams = trigrams(name or u'')
+            if not grams:
+                continue
+            position = len(self._keys)
+            self._keys.append(key)
+            self._names.append(name)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = array('l')
+                postings.append(position)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, name, limit=5, accept=None):
+        """
+        Return up to limit (key, name, similarity) tuples, best first.
+        accept, if given, is called with a key and filters the candidates.
+        """
+        grams = trigrams(name)
+        shared = {}
+        for gram in grams:
+            for position in self._postings.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        def scored():
+            for position, count in shared.iteritems():
+                similarity = float(count) / (
+                    len(grams) + self._sizes[position] - count)
+                if similarity < MIN_SIMILARITY:
+                    continue
+                if accept is not None and not accept(self._keys[position]):
+                    continue
+                yield similarity, position
+
+        return [(self._keys[position], self._names[position], similarity)
+                for similarity, position
+                in heapq.nlargest(limit, scored())]
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
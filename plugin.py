@@ -39,11 +39,154 @@ import psycopg2
 import psycopg2.extras
 import psycopg2.pool
 import eveapi
+import apicache
 import datetime
+import executor
+import functools
+import itertools
+import threading
+import cache
+import db
+import names
+import rollups
+import sde
+import sdestore
+
+MEMBER_SQL = """
+SELECT name, location, "shipType" FROM corporation_membertracking """
+STARBASE_SQL = """
+SELECT "locationID", "moonID", "typeID", state FROM corporation_starbase """
+BOUNTY_WINDOWS = {
+    'day': 'today',
+    'week': 'the last 7 days',
+    'month': 'the last 30 days',
+    'all': 'all time',
+}
+
+class UnknownName(Exception):
+    def __init__(self, name, suggestions=()):
+        Exception.__init__(self, name)
+        self.suggestions = suggestions
+
+class UnknownLocation(UnknownName):
+    pass
+
+class UnknownType(UnknownName):
+    pass
 
-class UnknownLocation(BaseException):
+class UnknownCorporation(UnknownName):
     pass
 
+def _normalize(value):
+    # case is kept: chars matches usernames exactly, and most replies echo
+    # the argument as it was typed
+    if isinstance(value, basestring):
+        return ' '.join(value.split())
+    if isinstance(value, (list, tuple)):
+        return tuple(sorted(_normalize(v) for v in value))
+    return value
+
+def queued(f):
+    """
+    Run a command on the plugin's executor rather than in the thread that
+    read it from IRC, or reply that the bot is busy when it cannot be
+    queued.
+    """
+    @functools.wraps(f)
+    def newf(self, irc, msg, args, *rest):
+        def run():
+            try:
+                f(self, irc, msg, args, *rest)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except BaseException:
+                self.log.exception('Uncaught exception in {0}'.format(
+                    f.__name__))
+                irc.replyError()
+        channel = msg.args[0]
+        if not ircutils.isChannel(channel):
+            # a private message, only the user's limit applies
+            channel = None
+        try:
+            self.executor.submit(channel, msg.prefix, run)
+        except executor.Busy, e:
+            irc.reply('Busy, try again in a moment. {0}.'.format(e))
+    return newf
+
+def shared(f):
+    """
+    Let concurrent invocations of a command with the same arguments share
+    one run. The others get the replies of that run replayed. The channel
+    argument only counts through its access settings, so the same command
+    from channels with the same access is shared too.
+    """
+    @functools.wraps(f)
+    def newf(self, irc, msg, args, *rest):
+        key = (f.__name__, tuple(self._access(arg) for arg in rest))
+        ran = []
+
+        def run():
+            ran.append(True)
+            recorder = cache.Recorder(irc)
+            try:
+                f(self, recorder, msg, args, *rest)
+            except db.BudgetExceeded:
+                return recorder.replies, True
+            return recorder.replies, False
+        try:
+            replies, truncated = self.shared_commands.do(key, db.remaining(),
+                                                         run)
+        except cache.Pending:
+            raise db.BudgetExceeded()
+        if not ran:
+            cache.replay(irc, replies)
+        if truncated:
+            raise db.BudgetExceeded()
+    return newf
+
+def time_budget(f):
+    """
+    Run a command within the time budget of the channel it was given in.
+    Queries that would overrun it are cancelled and the command ends with
+    what it has replied so far and a note that the output is truncated.
+    """
+    @functools.wraps(f)
+    def newf(self, irc, msg, args, *rest):
+        seconds = self.registryValue('command_time_budget', msg.args[0])
+        try:
+            with db.budget(seconds):
+                f(self, irc, msg, args, *rest)
+        except db.BudgetExceeded:
+            irc.reply('[truncated: {0} took longer than {1}s]'.format(
+                f.__name__, seconds), prefixNick=False)
+    return newf
+
+def cached_reply(*apicalls):
+    """
+    Cache the replies of a command until stationspinner records a new
+    update of one of the corporation apicalls its data comes from. Replies
+    are keyed by command and normalized arguments, with channels standing
+    for their current full_access and max_lines settings, so changing
+    these takes effect at once. Commands that reply with an error or run
+    out of time are not cached.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def newf(self, irc, msg, args, *rest):
+            key = (f.__name__, tuple(self._access(arg) for arg in rest))
+            version = self._data_version(apicalls)
+            cached = self.reply_cache.get(key)
+            if cached is not None and cached[0] == version:
+                cache.replay(irc, cached[1])
+                return
+            recorder = cache.Recorder(irc)
+            f(self, recorder, msg, args, *rest)
+            if not recorder.errors:
+                self.reply_cache.set(key, (version, recorder.replies),
+                                     self.registryValue('reply_cache_ttl'))
+        return newf
+    return decorator
+
 
 class EVESpai(callbacks.Plugin):
     """
@@ -57,113 +200,416 @@ class EVESpai(callbacks.Plugin):
     'chars <user>' List all characters belonging to <user>
     'price [--location=(<solarsystem>|<region>)] <typeName>' List buy/sell/volume of <type> in <location>, defaults to JIta.
     """
-    threaded = True
+    threaded = False
 
     def __init__(self, irc):
         self.__parent = super(EVESpai, self)
         self.__parent.__init__(irc)
+        self.snapshot = sde.Snapshot()
+        self.location_memo = cache.Memo('Location names')
+        self.reply_cache = cache.Memo('Replies',
+            maxsize=self.registryValue('reply_cache_size'))
+        self.bounties = rollups.BountyRollup()
+        self.api_cache = None
+        self._open_api_cache()
+        self.assets = rollups.AssetRollup()
+        self.bounty_version = None
+        self.stationspinner = self.sde = None
+        self.statements = db.Statements()
+        self.shared_queries = cache.SingleFlight('Shared queries')
+        self.shared_commands = cache.SingleFlight('Shared commands')
+        self.rollup_updates = cache.SingleFlight('Rollup updates')
+        self.executor = executor.Executor('Commands',
+            self.registryValue('command_workers'),
+            self.registryValue('command_queue_size'),
+            self.registryValue('max_commands_per_channel'),
+            self.registryValue('max_commands_per_user'),
+            log=self.log)
+        self._cursor_ids = itertools.count()
+        self._stopping = threading.Event()
+        if self.registryValue('sde_store'):
+            self._open_store()
         self._connect(irc)
+        if self.registryValue('sde_snapshot') and not len(self.snapshot.types):
+            loader = threading.Thread(target=self._load_snapshot,
+                                      name='EVESpai SDE snapshot')
+            loader.daemon = True
+            loader.start()
+
+    def die(self):
+        self._stopping.set()
+        self.executor.shutdown()
+        eveapi._connections.closeall()
+        for pool in (self.stationspinner, self.sde):
+            if pool is not None:
+                pool.closeall()
+        self.__parent.die()
+
+    def _pool(self, name, replica=None):
+        def settings():
+            kwargs = dict(
+                host=self.registryValue(name + '_host'),
+                port=self.registryValue(name + '_port'),
+                dbname=self.registryValue(name + '_database'),
+                user=self.registryValue(name + '_user'),
+                password=self.registryValue(name + '_password'),
+                connect_timeout=self.registryValue(name + '_connect_timeout'),
+                keepalives=1,
+                keepalives_idle=self.registryValue('keepalives_idle'),
+                keepalives_interval=self.registryValue('keepalives_interval'),
+                keepalives_count=self.registryValue('keepalives_count'))
+            if replica:
+                host, _, port = replica.partition(':')
+                kwargs['host'] = host
+                if port:
+                    kwargs['port'] = port
+            return (self.registryValue(name + '_pool_min'),
+                    self.registryValue(name + '_pool_max'),
+                    kwargs)
+        if replica:
+            label = '{0}@{1}'.format(name, replica)
+        else:
+            label = name
+        return db.Pool(label, settings,
+                       max_hold=self.registryValue('max_checkout_time'),
+                       idle_check=self.registryValue('pool_idle_check'),
+                       max_backoff=self.registryValue('pool_max_backoff'),
+                       log=self.log)
+
+    def _router(self, name):
+        return db.Router(name, self._pool(name),
+                         [self._pool(name, replica) for replica in
+                          self.registryValue(name + '_replicas')],
+                         max_lag=self.registryValue('max_replica_lag'),
+                         lag_check=self.registryValue('replica_lag_check'),
+                         log=self.log)
 
     def _connect(self, irc):
-
-        try:
-            self.stationspinner = psycopg2.pool.ThreadedConnectionPool(2, 20,
-                host=self.registryValue('stationspinner_host'),
-                port=self.registryValue('stationspinner_port'),
-                dbname=self.registryValue('stationspinner_database'),
-                user=self.registryValue('stationspinner_user'),
-                password=self.registryValue('stationspinner_password'))
-        except Exception, e:
-            irc.error('Could not connect to stationspinner database. "{0}"'.format(e))
-        try:
-            self.sde = psycopg2.pool.ThreadedConnectionPool(2, 20,
-                host=self.registryValue('sde_host'),
-                port=self.registryValue('sde_port'),
-                dbname=self.registryValue('sde_database'),
-                user=self.registryValue('sde_user'),
-                password=self.registryValue('sde_password'))
-        except Exception, e:
-            irc.error('Could not connect to sde database. "{0}"'.format(e))
-
+        """
+        Set up the database pools and their read replicas. No connections
+        are made until the first query, so an unreachable database does not
+        hold up plugin loading.
+        """
+        self.stationspinner = self._router('stationspinner')
+        if isinstance(self.snapshot, sdestore.Store):
+            # the local store answers all SDE lookups
+            self.sde = None
+        else:
+            self.sde = self._router('sde')
+        self._corporationID = None
         if self.registryValue('corporation') == '':
             irc.error('EVESpai requires that you set a corporation')
-        try:
-            cur = self.stationspinner.getconn().cursor()
-            cur.execute("""
+
+    @property
+    def corporationID(self):
+        if self._corporationID is None:
+            row = self._sql("""
             SELECT "corporationID"
             FROM corporation_corporationsheet
             WHERE "corporationName"=%s and "enabled"=true
             """, [self.registryValue('corporation')])
-            self.corporationID = cur.fetchone()[0]
-            cur.close()
-        except Exception, e:
-            irc.error('Could not find corporation "{0}" in stationspinner database'.format(self.corporation))
-
-    def _sql(self, sql, argslist, single=True, db='stationspinner'):
-        conn = getattr(self, db).getconn()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            if row is None:
+                raise UnknownCorporation(self.registryValue('corporation'))
+            self._corporationID = row[0]
+        return self._corporationID
 
-        cur.execute(sql, argslist)
-        if single:
-            data = cur.fetchone()
-        else:
-            data = cur.fetchall()
-        cur.close()
-        getattr(self, db).putconn(conn)
+    def _sql(self, sql, argslist, single=True, database='stationspinner',
+             prepare=None):
+        """
+        Run sql on the stationspinner or sde database, or one of its read
+        replicas. Queries given a prepare name are prepared once per
+        connection and executed by name. Identical queries running at the
+        same time share one execution.
+        """
+        pool = getattr(self, database, None)
+        if pool is None:
+            # no such database configured
+            return None if single else []
+        key = (database, sql, cache.freeze(argslist), single)
+        try:
+            return self.shared_queries.do(key, db.remaining(), self._run,
+                                          pool, sql, argslist, single,
+                                          database, prepare)
+        except cache.Pending:
+            raise db.BudgetExceeded()
+
+    def _run(self, pool, sql, argslist, single, database, prepare):
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                if prepare:
+                    statement = self.statements.get(prepare, sql, database)
+                    statement.execute(cur, argslist)
+                else:
+                    cur.execute(sql, argslist)
+                if single:
+                    data = cur.fetchone()
+                else:
+                    data = cur.fetchall()
+            finally:
+                cur.close()
         return data
 
 
 
 
+    def _stream(self, sql, argslist, database='stationspinner'):
+        """
+        Yield the rows of sql as they arrive. Rows are fetched in batches
+        of stream_batch_size through a server-side cursor, which keeps its
+        connection checked out until the generator is exhausted or closed.
+        """
+        pool = getattr(self, database, None)
+        if pool is None:
+            return
+        with pool.connection(record=False) as conn:
+            cur = conn.cursor(name='evespai_stream_{0}'.format(
+                                  next(self._cursor_ids)))
+            cur.itersize = self.registryValue('stream_batch_size')
+            try:
+                cur.execute(sql, argslist)
+                for row in cur:
+                    yield row
+            finally:
+                cur.close()
+
+    def _sde_rows(self, sql, argslist=None):
+        return self._sql(sql, argslist, single=False, database='sde')
+
+    def _open_api_cache(self):
+        path = self.registryValue('api_cache_dir') or \
+            conf.supybot.directories.data.dirize('EVESpai/api')
+        try:
+            self.api_cache = apicache.MemoryCache(
+                apicache.DiskCache(path, log=self.log),
+                max_entries=self.registryValue('api_memory_entries'),
+                max_bytes=self.registryValue('api_memory_bytes'))
+            self.api_cache.purge()
+        except (IOError, OSError), e:
+            self.log.warning('Could not open API cache. "{0}"'.format(e))
+
+    def _open_store(self):
+        try:
+            store = sdestore.Store(self.registryValue('sde_store'))
+        except Exception, e:
+            self.log.warning('Could not open SDE store. "{0}"'.format(e))
+            return
+        self.snapshot = store
+        self.log.info('Opened SDE store: {0}'.format(store))
+
+    def _load_snapshot(self):
+        """
+        Load the SDE snapshot, retrying with a growing delay of up to
+        pool_max_backoff seconds while the sde database cannot be read.
+        Runs on a thread of its own; lookups go to the database until the
+        snapshot is in.
+        """
+        delay = 1
+        while not self._stopping.is_set():
+            try:
+                snapshot = sde.Snapshot().load(self._sde_rows)
+            except Exception, e:
+                delay = min(delay * 2, self.registryValue('pool_max_backoff'))
+                self.log.warning('Could not load SDE snapshot, retrying in '
+                                 '{0}s. "{1}"'.format(delay, e))
+                self._stopping.wait(delay)
+                continue
+            self.snapshot = snapshot
+            self.log.info('Loaded SDE snapshot: {0}'.format(snapshot))
+            return
+
     def _get_SolarSystemID(self, system_name):
+        solarSystemID = self.snapshot.system_names.match(system_name)
+        if solarSystemID is not None:
+            return solarSystemID
         row = self._sql("""SELECT "solarSystemID" FROM "mapSolarSystems"
-        WHERE "solarSystemName" ILIKE %s """, [system_name], db='sde')
+        WHERE "solarSystemName" ILIKE %s """, [system_name], database='sde',
+                        prepare='system_id')
         return row['solarSystemID']
 
     def _get_SolarSystem(self, solarSystemID):
-        row = self._sql("""SELECT * FROM "mapSolarSystems"
-        WHERE "solarSystemID" = %s""", [solarSystemID], db='sde')
+        row = self.snapshot.systems.get(solarSystemID)
+        if row:
+            return row
+        row = self._sql(sde.SYSTEM_SQL + """
+        WHERE "solarSystemID" = %s""", [solarSystemID], database='sde',
+                        prepare='system')
         if not row:
             raise UnknownLocation(solarSystemID)
-        return row
+        return self.snapshot.systems.add(row)
 
     def _get_locationID(self, location_name):
+        locationID = self.snapshot.location_names.match(location_name)
+        if locationID is not None:
+            return locationID
         row = self._sql("""SELECT "itemID" FROM "mapDenormalize"
-        WHERE "itemName" ILIKE %s""", [location_name], db='sde')
-        return row['itemID']
+        WHERE "itemName" ILIKE %s""", [location_name], database='sde',
+                        prepare='location_id')
+        if row:
+            return row['itemID']
+        return self._suggest('locations', location_name, UnknownLocation)
 
     def _get_location(self, locationID):
-        row = self._sql("""SELECT * FROM "mapDenormalize"
-        WHERE "itemID"=%s""", [locationID], db='sde')
+        row = self.snapshot.locations.get(locationID)
+        if row:
+            return row
+        row = self._sql(sde.LOCATION_SQL + """
+        WHERE "itemID"=%s""", [locationID], database='sde',
+                        prepare='location')
         if not row:
             raise UnknownLocation(locationID)
-        return row
+        return self.snapshot.locations.add(row)
 
     def _get_location_by_name(self, locationName):
-        row = self._sql("""SELECT * FROM "mapDenormalize"
-        WHERE "itemName" ILIKE %s""", [locationName], db='sde')
-        if not row:
-            station = self._sql(""" SELECT * FROM universe_conquerablestation
-            WHERE "stationName" ILIKE %s""", [locationName])
-            row = {'itemName': station['stationName']}
-            solarsystem = self._sql("""SELECT * FROM "mapDenormalize"
-             WHERE "itemID"=%s""", [station['solarSystemID']], db='sde')
-
-            if not solarsystem:
-                row['security'] = 0.0
-            else:
-                row['security'] = solarsystem['security']
-        return row
-
-    def _get_typeID(self, type_name):
+        key = names.fold(locationName)
+        row = self.location_memo.get(key)
+        if row is not None:
+            return row
+
+        locationID = self.snapshot.location_names.match(locationName)
+        if locationID is not None:
+            return self.location_memo.set(key, self._get_location(locationID))
+        row = self._sql(sde.LOCATION_SQL + """
+        WHERE lower("itemName") = lower(%s)""", [locationName], database='sde',
+                        prepare='location_by_name')
+        if row:
+            return self.location_memo.set(key, row)
+
+        # Conquerable stations can be renamed by their owners, so these are
+        # only kept for a while.
+        ttl = self.registryValue('station_cache_ttl')
+        station = self._sql("""
+        SELECT "stationName", "solarSystemID" FROM universe_conquerablestation
+        WHERE lower("stationName") = lower(%s)""", [locationName],
+                           prepare='conquerable_station')
+        if not station:
+            return self.location_memo.set(key,
+                {'itemName': locationName, 'security': 0.0}, ttl)
+        row = {'itemName': station['stationName']}
+        try:
+            solarsystem = self._get_location(station['solarSystemID'])
+            row['security'] = solarsystem['security']
+        except UnknownLocation:
+            row['security'] = 0.0
+        return self.location_memo.set(key, row, ttl)
+
+    def _get_typeID(self, type_name, accept=None):
+        typeID = self.snapshot.type_names.match(type_name)
+        if typeID is not None and (accept is None or accept(typeID)):
+            return typeID
         row = self._sql("""SELECT "typeID" FROM "invTypes"
-        WHERE "typeName" ILIKE %s AND published=true""", [type_name], db='sde')
-        return row['typeID']
+        WHERE "typeName" ILIKE %s AND published=true""", [type_name], database='sde',
+                        prepare='type_id')
+        if row and (accept is None or accept(row['typeID'])):
+            return row['typeID']
+        return self._suggest('types', type_name, UnknownType, accept)
+
+    def _suggest(self, kind, name, unknown, accept=None):
+        """
+        Return the ID of the one name clearly meant by a misspelt name, or
+        raise unknown with the closest names as suggestions.
+        """
+        matches = self.snapshot.suggest(kind, name.replace('%', ' '),
+                                        accept=accept)
+        if names.clear_winner(matches):
+            return matches[0][0]
+        raise unknown(name, [m[1] for m in matches])
+
+    def _did_you_mean(self, e):
+        suggestions = getattr(e, 'suggestions', None)
+        if not suggestions:
+            return ''
+        return '. Did you mean {0}?'.format(', '.join(suggestions))
 
     def _get_type(self, typeID):
-        row = self._sql("""SELECT * FROM "invTypes"
-        WHERE "typeID" = %s AND published=true""", [typeID], db='sde')
-        return row
+        row = self.snapshot.types.get(typeID)
+        if row:
+            return row
+        row = self._sql(sde.TYPE_SQL + """
+        WHERE "typeID" = %s AND published=true""", [typeID], database='sde',
+                        prepare='type')
+        if not row:
+            return None
+        return self.snapshot.types.add(row)
+
+    def _get_ship_groups(self, pattern):
+        if len(self.snapshot.groups):
+            return [self.snapshot.groups.get(groupID) for groupID
+                    in self.snapshot.ship_group_names.match_all(pattern)]
+        return self._sql("""
+        SELECT "groupID", "groupName" FROM "invGroups"
+        WHERE "categoryID"=6 and "groupName" ILIKE %s AND published=true""", [pattern], database='sde', single=False,
+                         prepare='ship_groups')
+
+    def _get_types_in_group(self, groupID):
+        if len(self.snapshot.types):
+            return self.snapshot.types_in_group(groupID)
+        return self._sql("""
+        SELECT "typeID", "typeName" FROM "invTypes"
+        WHERE "groupID"=%s AND published=true""", [groupID], database='sde', single=False,
+                         prepare='group_types')
+
+    def _is_ship(self, typeID):
+        itemType = self._get_type(typeID)
+        group = itemType and self.snapshot.groups.get(itemType['groupID'])
+        return bool(group) and group['categoryID'] == sde.SHIP_CATEGORY
+
+    def _resolve(self, systems=(), locations=(), types=()):
+        """
+        Look up many solar systems, map items and types at once. Returns
+        three dicts of ID -> row, leaving out IDs that do not exist.
+        """
+        return self.snapshot.resolve(self._sde_rows, systems, locations, types)
+
+    def _access(self, arg):
+        """
+        Normalize a command argument for sharing, channels become their
+        access settings.
+        """
+        if isinstance(arg, basestring) and ircutils.isChannel(arg):
+            return ('channel', self.registryValue('full_access', arg),
+                    self.registryValue('max_lines', arg))
+        return _normalize(arg)
+
+    def _update_rollup(self, key, f, *args):
+        """
+        Bring a rollup up to date with f(*args) on a thread of its own,
+        outside the command's time budget, which a first build from a big
+        table can take longer than. Waits as long as the budget allows; an
+        update still running then ends the command as truncated and
+        carries on for the next one.
+        """
+        try:
+            self.rollup_updates.background(key, db.remaining(), f, *args)
+        except cache.Pending:
+            raise db.BudgetExceeded()
+
+    def _update_bounties(self, version):
+        self.bounties.refresh(self._stream, self.corporationID)
+        self.bounty_version = version
+
+    def _data_version(self, apicalls):
+        """
+        Return the last update stamps of the named corporation apicalls.
+        """
+        rows = self._sql("""
+        SELECT c.name, u.last_update
+        FROM accounting_apiupdate u
+        JOIN universe_apicall c ON c.id = u.apicall_id
+        WHERE u.owner = %s AND c.type = 'Corporation' AND c.name = ANY(%s)
+        ORDER BY c.name""", [self.corporationID, list(apicalls)],
+                         single=False, prepare='data_version')
+        return tuple((row[0], row[1]) for row in rows)
+
+    def _format_member(self, row):
+        if row['shipType'] == 'Unknown Type':
+            ship = 'Pod'
+        else:
+            ship = row['shipType']
+        return '{0} :: {1} :: {2}'.format(
+            ircutils.bold(row['name']),
+            self._colorize_system(self._get_location_by_name(row['location'])),
+            ship)
 
     def _colorize_system(self, location):
         try:
@@ -186,6 +632,8 @@ class EVESpai(callbacks.Plugin):
             return ircutils.mircColor(name, fg='red')
 
 
+    @queued
+    @shared
     def locationid(self, irc, msg, args, locationName):
         """[<location>]
 
@@ -194,11 +642,13 @@ class EVESpai(callbacks.Plugin):
         try:
             locationID = self._get_locationID(locationName)
             irc.reply(locationID, prefixNick=False)
-        except:
-            irc.error('Unknown location')
+        except BaseException, e:
+            irc.error('Unknown location{0}'.format(self._did_you_mean(e)))
 
     locationid = wrap(locationid, ['text'])
 
+    @queued
+    @shared
     def locationname(self, irc, msg, args, locationID):
         """[<location>]
 
@@ -212,6 +662,8 @@ class EVESpai(callbacks.Plugin):
 
     locationname = wrap(locationname, ['text'])
 
+    @queued
+    @shared
     def typename(self, irc, msg, args, typeID):
         """[<typeID>]
 
@@ -225,6 +677,8 @@ class EVESpai(callbacks.Plugin):
 
     typename = wrap(typename, ['text'])
 
+    @queued
+    @shared
     def typeid(self, irc, msg, args, typeName):
         """[<typeName>]
 
@@ -233,16 +687,18 @@ class EVESpai(callbacks.Plugin):
         try:
             typeID = self._get_typeID(typeName)
             irc.reply(typeID, prefixNick=False)
-        except:
-            irc.error('Unknown type')
+        except BaseException, e:
+            irc.error('Unknown type{0}'.format(self._did_you_mean(e)))
 
     typeid = wrap(typeid, ['text'])
 
+    @queued
+    @shared
     def evetime(self, irc, msg, args):
         """
         Get current time on Tranquility
         """
-        api = eveapi.EVEAPIConnection()
+        api = eveapi.EVEAPIConnection(cacheHandler=self.api_cache)
         status = api.server.ServerStatus()
         tq_time = datetime.datetime.utcfromtimestamp(status._meta.currentTime)
         SERVER_STATUS = {
@@ -259,6 +715,10 @@ class EVESpai(callbacks.Plugin):
     status = wrap(evetime, [])
 
 
+    @queued
+    @time_budget
+    @shared
+    @cached_reply('StarbaseList')
     def pos(self, irc, msg, args, channel, system):
         """[<channel>] [<system>]
 
@@ -272,21 +732,19 @@ class EVESpai(callbacks.Plugin):
             try:
                 locationID = self._get_locationID(system)
                 solar_system = self._get_SolarSystem(locationID)
-            except:
-                irc.error('Unknown location')
+            except BaseException, e:
+                irc.error('Unknown location{0}'.format(self._did_you_mean(e)))
                 return
 
-            rows = self._sql("""
-            SELECT *
-            FROM corporation_starbase
+            rows = self._sql(STARBASE_SQL + """
             WHERE owner_id = %s AND "locationID" = %s""", [self.corporationID,
-                                                         locationID], single=False)
+                                                         locationID], single=False,
+                             prepare='pos_system')
         else:
-            rows = self._sql("""
-            SELECT *
-            FROM corporation_starbase
+            rows = self._sql(STARBASE_SQL + """
             WHERE owner_id = %s
-            ORDER BY "locationID", "moonID" """, [self.corporationID], single=False)
+            ORDER BY "locationID", "moonID" """, [self.corporationID], single=False,
+                             prepare='pos')
         count = len(rows)
 
         STATES = {
@@ -298,9 +756,7 @@ class EVESpai(callbacks.Plugin):
             3: 	ircutils.mircColor('Reinforced', fg='red'),           # Until time = stateTimestamp.
             4: 	ircutils.mircColor('Online', fg='green') 	            # Continuously since time = onlineTimestamp.
         }
-        locations = {}
         if system:
-            locations[solar_system['solarSystemID']] = solar_system
             irc.reply('Found {0} starbases in {1}'.format(
                              ircutils.bold(count),
                              self._colorize_system(solar_system)),
@@ -308,45 +764,56 @@ class EVESpai(callbacks.Plugin):
         else:
             irc.reply('Found {0} starbases'.format(count), prefixNick=False)
 
+        systems, moons, types = self._resolve(
+            systems=[row['locationID'] for row in rows],
+            locations=[row['moonID'] for row in rows],
+            types=[row['typeID'] for row in rows])
+        _, regions, _ = self._resolve(
+            locations=[s['regionID'] for s in systems.itervalues()])
+
         for row in rows:
             locationID = int(row['locationID'])
             try:
                 state = STATES[int(row['state'])]
             except:
                 state = 'Unknown'
-            if not locationID in locations:
-                try:
-                    solar_system = self._get_SolarSystem(locationID)
-                    locations[locationID] = solar_system
-                except UnknownLocation:
-                    irc.reply('{0} :: {1} :: {2} :: {3} :: {4}'.format(
-                                     'Unknown region',
-                                     'Unknown solarsystem {0}'.format(locationID), #solarsystem
-                                     'n/a', #moon
-                                     self._get_type(int(row['typeID']))['typeName'], #pos type
-                                     state #offline/online
-                                     ), prefixNick=False)
-                    continue
-            else:
-                solar_system = locations[locationID]
-
-            if not solar_system['regionID'] in locations:
-                region = self._get_location(solar_system['regionID'])
-                locations[solar_system['regionID']] = region
-            else:
-                region = locations[solar_system['regionID']]
-
+            try:
+                tower = types[int(row['typeID'])]['typeName']
+            except KeyError:
+                tower = 'Unknown type {0}'.format(row['typeID'])
+            try:
+                moon = moons[int(row['moonID'])]['itemName']
+            except KeyError:
+                moon = 'n/a'
+            if not locationID in systems:
+                irc.reply('{0} :: {1} :: {2} :: {3} :: {4}'.format(
+                                 'Unknown region',
+                                 'Unknown solarsystem {0}'.format(locationID), #solarsystem
+                                 moon, #moon
+                                 tower, #pos type
+                                 state #offline/online
+                                 ), prefixNick=False)
+                continue
+            solar_system = systems[locationID]
+            try:
+                region = regions[solar_system['regionID']]['itemName']
+            except KeyError:
+                region = 'Unknown region'
 
             irc.reply('{0} :: {1} :: {2} :: {3} :: {4}'.format(
-                             region['itemName'],
+                             region,
                              self._colorize_system(solar_system), #solarsystem
-                             self._get_location(row['moonID'])['itemName'], #moon
-                             self._get_type(int(row['typeID']))['typeName'], #pos type
+                             moon, #moon
+                             tower, #pos type
                              state #offline/online
                              ), prefixNick=False)
 
     pos = wrap(pos, [optional('channel'), optional('text')])
 
+    @queued
+    @time_budget
+    @shared
+    @cached_reply('MemberTracking')
     def whereis(self, irc, msg, args, channel, character):
         """[<channel>] <character>
 
@@ -356,25 +823,20 @@ class EVESpai(callbacks.Plugin):
             irc.reply('Concord denies you access on this channel!')
             return
 
-        rows = self._sql("""
-        SELECT * FROM corporation_membertracking
-        WHERE name ILIKE %s AND owner_id=%s""", [character, self.corporationID], single=False)
+        rows = self._sql(MEMBER_SQL + """
+        WHERE name ILIKE %s AND owner_id=%s""", [character, self.corporationID], single=False,
+                         prepare='whereis')
 
         if len(rows) > 0:
             for row in rows:
-                if row['shipType'] == 'Unknown Type':
-                    ship = 'Pod'
-                else:
-                    ship = row['shipType']
-                irc.reply('{0} :: {1} :: {2}'.format(
-                    ircutils.bold(row['name']),
-                    self._colorize_system(self._get_location_by_name(row['location'])),
-                    ship
-                ), prefixNick=False)
+                irc.reply(self._format_member(row), prefixNick=False)
         else:
             irc.reply('Found 0 characters with a name like "{0}"'.format(character))
     whereis = wrap(whereis, [optional('channel'), 'text'])
 
+    @queued
+    @time_budget
+    @shared
     def cache(self, irc, msg, args, channel, apicall):
         """[<channel>] <APICall>
 
@@ -384,15 +846,17 @@ class EVESpai(callbacks.Plugin):
             irc.reply('Concord denies you access on this channel!')
             return
 
-        call = self._sql("""SELECT * FROM universe_apicall
-        WHERE name ILIKE %s AND type='Corporation'""", [apicall])
+        call = self._sql("""SELECT id, name FROM universe_apicall
+        WHERE name ILIKE %s AND type='Corporation'""", [apicall],
+                         prepare='apicall')
         if not call:
             irc.error('Unknown APICall')
             return
         else:
             update = self._sql("""
-            SELECT * FROM accounting_apiupdate
-            WHERE apicall_id=%s AND owner = %s""", [call['id'], self.corporationID])
+            SELECT last_update FROM accounting_apiupdate
+            WHERE apicall_id=%s AND owner = %s""", [call['id'], self.corporationID],
+                               prepare='apiupdate')
 
             if not update['last_update']:
                 updated = 'never'
@@ -404,6 +868,10 @@ class EVESpai(callbacks.Plugin):
             ), prefixNick=False)
     cache = wrap(cache, [optional('channel'), 'text'])
 
+    @queued
+    @time_budget
+    @shared
+    @cached_reply('MemberTracking')
     def whoat(self, irc, msg, args, channel, optlist, system):
         """[<channel>] [--all] <system>
 
@@ -414,37 +882,36 @@ class EVESpai(callbacks.Plugin):
             irc.reply('Concord denies you access on this channel!')
             return
 
-        rows = self._sql("""
-        SELECT * FROM corporation_membertracking
-        WHERE location ILIKE %s AND owner_id=%s""", ['%%{0}%%'.format(system),
-                                                     self.corporationID], single=False)
-        if len(rows) == 0:
+        sql = MEMBER_SQL + """
+        WHERE location ILIKE %s AND owner_id=%s"""
+        argslist = ['%%{0}%%'.format(system), self.corporationID]
+        if ('all', True) in optlist:
+            rows = self._stream(sql, argslist)
+        else:
+            rows = self._sql(sql, argslist, single=False, prepare='whoat')
+            if len(rows) > self.registryValue('max_lines', channel):
+                irc.reply('Found {0} characters in "{1}", but will not name them all'.format(
+                    len(rows), system
+                ), prefixNick=False)
+                return
+
+        count = 0
+        for row in rows:
+            count += 1
+            irc.reply(self._format_member(row), prefixNick=False)
+        if count == 0:
             irc.reply('Found 0 characters in "{0}"'.format(
                 system
             ), prefixNick=False)
-            return
-
-        if len(rows) <= self.registryValue('max_lines', channel) or ('all', True) in optlist \
-                and len(rows) > 0:
-            for row in rows:
-                if row['shipType'] == 'Unknown Type':
-                    ship = 'Pod'
-                else:
-                    ship = row['shipType']
-                irc.reply('{0} :: {1} :: {2}'.format(
-                    ircutils.bold(row['name']),
-                    self._colorize_system(self._get_location_by_name(row['location'])),
-                    ship
-                ), prefixNick=False)
-        elif len(rows) > self.registryValue('max_lines', channel):
-            irc.reply('Found {0} characters in "{1}", but will not name them all'.format(
-                len(rows), system
-            ), prefixNick=False)
 
     whoat = wrap(whoat, [optional('channel'),
                          getopts({'all': ''}),
                          'text'])
 
+    @queued
+    @time_budget
+    @shared
+    @cached_reply('MemberTracking')
     def ship(self, irc, msg, args, channel, optlist, shiptype):
         """[<channel>] [--all] <shiptype>
 
@@ -455,9 +922,7 @@ class EVESpai(callbacks.Plugin):
             irc.reply('Concord denies you access on this channel!')
             return
 
-        rows = self._sql("""
-        SELECT "groupID", "groupName" FROM "invGroups"
-        WHERE "categoryID"=6 and "groupName" ILIKE %s AND published=true""", ['%%{0}%%'.format(shiptype)], db='sde', single=False)
+        rows = self._get_ship_groups('%%{0}%%'.format(shiptype))
 
         if len(rows) > 1:
             irc.reply('Found more than one shiptype: "{0}". Be more specific'.format(
@@ -468,60 +933,61 @@ class EVESpai(callbacks.Plugin):
         if len(rows) == 1:
             invGroup = rows[0]
             #find the ships which match the groupID of the ship type
-            ships = self._sql("""
-            SELECT "typeID", "typeName" FROM "invTypes"
-            WHERE "groupID"=%s AND published=true""", [invGroup['groupID']], db='sde', single=False)
+            ships = self._get_types_in_group(invGroup['groupID'])
             typeIDs = [s['typeID'] for s in ships]
+            shiptype = invGroup['groupName']
         else:
             # There was no group matching that name, but it could be a specific ship
-            invGroup = None
-            row = self._get_typeID('%%{0}%%'.format(shiptype))
-            if row:
-                typeIDs = [row,]
-                shiptype = self._get_type(row)['typeName']
+            if len(self.snapshot.groups):
+                accept = self._is_ship
             else:
-                irc.reply('Unknown shiptype', prefixNick=False)
+                accept = None
+            try:
+                row = self._get_typeID('%%{0}%%'.format(shiptype), accept)
+            except UnknownType, e:
+                irc.reply('Unknown shiptype{0}'.format(self._did_you_mean(e)),
+                          prefixNick=False)
                 return
-
-
-        rows = self._sql("""
-        SELECT * FROM corporation_membertracking
-        WHERE owner_id=%s AND "shipTypeID" IN %s""",
-                   [self.corporationID, tuple(typeIDs)], single=False)
-
-        if (len(rows) <= self.registryValue('max_lines', channel) or ('all', True) in optlist) \
-                and len(rows) > 0:
+            typeIDs = [row,]
+            shiptype = self._get_type(row)['typeName']
+
+
+        sql = MEMBER_SQL + """
+        WHERE owner_id=%s AND "shipTypeID" = ANY(%s)"""
+        argslist = [self.corporationID, list(typeIDs)]
+        if ('all', True) in optlist:
+            # the count is only known once all rows have been listed
+            count = 0
+            for row in self._stream(sql, argslist):
+                count += 1
+                irc.reply(self._format_member(row), prefixNick=False)
             irc.reply('Found {0} characters in {1}'.format(
-                len(rows),
-                invGroup['groupName']
+                count,
+                shiptype
             ), prefixNick=False)
-            for row in rows:
-                if row['shipType'] == 'Unknown Type':
-                    ship = 'Pod'
-                else:
-                    ship = row['shipType']
-                irc.reply('{0} :: {1} :: {2}'.format(
-                    ircutils.bold(row['name']),
-                    self._colorize_system(self._get_location_by_name(row['location'])),
-                    ship
-                ), prefixNick=False)
-        elif len(rows) > self.registryValue('max_lines', channel):
+            return
+
+        rows = self._sql(sql, argslist, single=False, prepare='ship')
+
+        if len(rows) > self.registryValue('max_lines', channel):
             irc.reply('Found {0} characters in {1}, but will not name them all'.format(
                 len(rows),
-                invGroup['groupName']
+                shiptype
             ), prefixNick=False)
         else:
-            if invGroup:
-                shiptype = invGroup['groupName']
-
             irc.reply('Found {0} characters in {1}'.format(
                 len(rows),
                 shiptype
             ), prefixNick=False)
+            for row in rows:
+                irc.reply(self._format_member(row), prefixNick=False)
     ship = wrap(ship, [optional('channel'),
                        getopts({'all': ''}),
                                'text'])
 
+    @queued
+    @time_budget
+    @shared
     def chars(self, irc, msg, args, channel, username):
         """[<channel>] <user>
 
@@ -532,15 +998,17 @@ class EVESpai(callbacks.Plugin):
             return
 
         user = self._sql("""
-        SELECT * FROM accounting_capsuler
-        WHERE username=%s""", [username])
+        SELECT id, username FROM accounting_capsuler
+        WHERE username=%s""", [username],
+                         prepare='capsuler')
         if not user:
             irc.error('Could not find user "{0}"'.format(username))
             return
 
         chars = self._sql("""
-        SELECT * FROM character_charactersheet
-        WHERE owner_id=%s""", [user['id']], single=False)
+        SELECT name, "corporationName" FROM character_charactersheet
+        WHERE owner_id=%s""", [user['id']], single=False,
+                         prepare='chars')
 
         if len(chars) == 0:
             irc.reply('User "{0}" has 0 characters registered'.format(user['username']),
@@ -558,6 +1026,9 @@ class EVESpai(callbacks.Plugin):
             ), prefixNick=False)
     chars = wrap(chars, [optional('channel'), 'text'])
 
+    @queued
+    @time_budget
+    @shared
     def player(self, irc, msg, args, channel, optlist, character):
         """[<channel>] <character>
 
@@ -566,32 +1037,39 @@ class EVESpai(callbacks.Plugin):
             irc.reply('Concord denies you access on this channel!')
             return
 
-        chars = self._sql("""
+        sql = """
         SELECT c.username, s.name AS character FROM accounting_capsuler c, character_charactersheet s
-        WHERE s.owner_id=c.id and s.name ILIKE %s;""", ['%%{0}%%'.format(character)], single=False)
-
-        if len(chars) == 0:
-            irc.reply('Found 0 characters like "{0}"'.format(character), prefixNick=False)
-            return
-
-        if (len(chars) <= self.registryValue('max_lines', channel) or ('all', True) in optlist) \
-                and len(chars) > 0:
-            for char in chars:
-                irc.reply('{0} :: {1}'.format(
-                    ircutils.bold(char['username']),
-                    ircutils.bold(char['character'])
+        WHERE s.owner_id=c.id and s.name ILIKE %s"""
+        argslist = ['%%{0}%%'.format(character)]
+        if ('all', True) in optlist:
+            chars = self._stream(sql, argslist)
+        else:
+            chars = self._sql(sql, argslist, single=False, prepare='player')
+            if len(chars) > self.registryValue('max_lines', channel):
+                irc.reply('Found {0} characters matching "{1}", but will list them all unless you use "owner --all {1}".'.format(
+                    len(chars),
+                    character,
                 ), prefixNick=False)
-        elif len(chars) > self.registryValue('max_lines', channel):
-            irc.reply('Found {0} characters matching "{1}", but will list them all unless you use "owner --all {1}".'.format(
-                len(chars),
-                character,
+                return
+
+        count = 0
+        for char in chars:
+            count += 1
+            irc.reply('{0} :: {1}'.format(
+                ircutils.bold(char['username']),
+                ircutils.bold(char['character'])
             ), prefixNick=False)
+        if count == 0:
+            irc.reply('Found 0 characters like "{0}"'.format(character), prefixNick=False)
 
     player = wrap(player, [optional('channel'),
                        getopts({'all': ''}),
                                'text'])
 
 
+    @queued
+    @time_budget
+    @shared
     def price(self, irc, msg, args, optlist, typeName):
         """[--location=(<solarsystem>|<region>)] <typeName>
 
@@ -601,8 +1079,8 @@ class EVESpai(callbacks.Plugin):
         try:
             typeID = self._get_typeID(typeName)
             itemType = self._get_type(typeID)
-        except:
-            irc.error('Unknown type')
+        except BaseException, e:
+            irc.error('Unknown type{0}'.format(self._did_you_mean(e)))
             return
 
         if len(optlist) == 1:
@@ -613,20 +1091,23 @@ class EVESpai(callbacks.Plugin):
         try:
             locationID = self._get_locationID(location)
             location = self._get_location(locationID)
-        except:
-            irc.error('Unknown location')
+        except BaseException, e:
+            irc.error('Unknown location{0}'.format(self._did_you_mean(e)))
             return
 
         market = self._sql("""
-        SELECT * FROM evecentral_market
-        WHERE "locationID"=%s""", [locationID])
+        SELECT "locationID" FROM evecentral_market
+        WHERE "locationID"=%s""", [locationID],
+                           prepare='market')
         if not market:
             irc.reply('No data for that market location')
             return
 
         marketitem = self._sql("""
-        SELECT * FROM evecentral_marketitem
-        WHERE "locationID"=%s AND "typeID"=%s""", [locationID, typeID])
+        SELECT buy_max, buy_volume, sell_min, sell_volume
+        FROM evecentral_marketitem
+        WHERE "locationID"=%s AND "typeID"=%s""", [locationID, typeID],
+                               prepare='market_item')
         if marketitem:
             irc.reply('{0} in {1}: buy max: {2} (volume: {3:,d}). sell min: {4} (volume: {5:,d}).'.format(
                 ircutils.bold(itemType['typeName']),
@@ -649,6 +1130,9 @@ class EVESpai(callbacks.Plugin):
     price = wrap(price, [getopts({'location': 'text'}),
                                     'text'])
 
+    @queued
+    @time_budget
+    @shared
     def markets(self, irc, msg, args):
         """
         List all price indexed markets.
@@ -658,10 +1142,14 @@ class EVESpai(callbacks.Plugin):
         if len(locationIDs) == 0:
             irc.reply('No prices have been indexed yet.', prefixNick=False)
             return
+        _, locations, _ = self._resolve(
+            locations=[row[0] for row in locationIDs])
         output = []
         for locationID in locationIDs:
             locationID = locationID[0]
-            location = self._get_location(locationID)
+            if not locationID in locations:
+                continue
+            location = locations[locationID]
             if locationID < 30000000:
                 # This would be a region
                 output.append(ircutils.bold(location['itemName']))
@@ -670,32 +1158,35 @@ class EVESpai(callbacks.Plugin):
         irc.reply(', '.join(output), prefixNick=False)
     markets = wrap(markets)
 
-    def meinshekels(self, irc, msg, args):
-        """
-        List top krabs
+    @queued
+    @time_budget
+    @shared
+    def meinshekels(self, irc, msg, args, window):
+        """[day|week|month|all]
+
+        List top krabs of the last day, week, month (default) or all time.
         """
-        rows = self._sql("""
-                SELECT t.username, t.sum FROM (SELECT DISTINCT ON (u.username)
-                u.username, SUM(j.amount) from corporation_walletjournal j
-                  RIGHT OUTER JOIN character_charactersheet c ON
-                  c."characterID"=j."ownerID2"
-                    RIGHT OUTER JOIN accounting_capsuler u ON u.id=c.owner_id
-                    WHERE j."refTypeID" IN (85, 99) AND j.date > CURRENT_DATE -
-                    INTERVAL '1 month' AND j.owner_id=%s
-                    GROUP BY u.username, j.amount) t ORDER BY t.sum DESC LIMIT
-                    5;
-            """, [self.corporationID], single=False)
-        print rows
+        version = self._data_version(('WalletJournal',))
+        if version != self.bounty_version:
+            self._update_rollup('bounties', self._update_bounties, version)
+        rows = self.bounties.top(window)
         if len(rows) == 0:
-            irc.reply('No bounties registered for last 30 days.')
+            irc.reply('No bounties registered for {0}.'.format(
+                BOUNTY_WINDOWS[window]))
         else:
             irc.reply('Top krabs:', prefixNick=False)
-            for row in rows:
+            for username, amount in rows:
                 irc.reply('{0}{1:>20}'.format(
-                    ircutils.bold('{:<20}'.format(row['username'])),
-                    '{:,}'.format(row['sum'])), prefixNick=False)
-    meinshekels = wrap(meinshekels)
-
+                    ircutils.bold('{:<20}'.format(username)),
+                    '{:,}'.format(amount)), prefixNick=False)
+    meinshekels = wrap(meinshekels, [optional(('literal',
+                                               ('day', 'week', 'month', 'all')),
+                                              'month')])
+
+    @queued
+    @time_budget
+    @shared
+    @cached_reply('AssetList')
     def howmany(self, irc, msg, args, channel, typeName, locationName):
         """[<channel>] <typeName> <locationName>
         List how many items matching <typeName> at location matching <locationName>.
@@ -703,36 +1194,22 @@ class EVESpai(callbacks.Plugin):
         if not self.registryValue('full_access', channel):
             irc.reply('Concord denies you access on this channel!')
             return
-        rows = self._sql("""
-        SELECT
-            "typeName",
-            "locationName",
-            SUM("quantity") as amount
-        FROM
-            corporation_asset
-        WHERE
-            "typeName" ILIKE %s AND
-            "locationName" ILIKE %s AND
-            owner_id = %s
-        GROUP BY
-            "typeName",
-            "locationName"
-        """, [
-            '%%{0}%%'.format(typeName),
-            '%%{0}%%'.format(locationName),
-            self.corporationID
-        ], single=False)
-
-        if len(rows) == 0:
-            irc.reply('Found 0 items at that location')
-            return
-        for row in rows:
-            location = self._get_location_by_name(row['locationName'])
+        version = self._data_version(('AssetList',))
+        if version != self.assets.version:
+            self._update_rollup('assets', self.assets.update, version,
+                                self._stream, self.corporationID)
+        rows = self.assets.find('%{0}%'.format(typeName),
+                                '%{0}%'.format(locationName))
+
+        for typeName, locationName, amount in rows:
+            location = self._get_location_by_name(locationName)
             irc.reply('{0} :: {1} :: {2}'.format(
-                row['typeName'],
+                typeName,
                 self._colorize_system(location),
-                ircutils.bold('{:,f}'.format(row['amount']))
+                ircutils.bold('{:,f}'.format(amount))
             ), prefixNick=False)
+        if len(rows) == 0:
+            irc.reply('Found 0 items at that location')
 
     howmany = wrap(howmany, [
         optional('channel'),
@@ -741,6 +1218,55 @@ class EVESpai(callbacks.Plugin):
     ])
 
 
+    def evestats(self, irc, msg, args):
+        """
+        Show command queue, database pool and cache statistics.
+        """
+        for stats in (self.executor, self.stationspinner, self.sde,
+                      self.statements, self.shared_queries,
+                      self.shared_commands, self.rollup_updates,
+                      self.location_memo, self.reply_cache, self.bounties,
+                      self.assets, self.api_cache):
+            if stats is None:
+                continue
+            for line in str(stats).splitlines():
+                irc.reply(line, prefixNick=False)
+    evestats = wrap(evestats, ['admin'])
+
+    @queued
+    def evecheckplans(self, irc, msg, args):
+        """
+        EXPLAIN the prepared statements with the arguments they last ran
+        with and report sequential scans on large tables.
+        """
+        min_rows = self.registryValue('large_table_rows')
+        checked = 0
+        slow = 0
+        for statement in self.statements:
+            pool = getattr(self, statement.database or '', None)
+            if not statement.executions or pool is None:
+                continue
+            try:
+                with pool.connection() as conn:
+                    cur = conn.cursor()
+                    try:
+                        scans = db.seq_scans(cur, statement, min_rows)
+                    finally:
+                        cur.close()
+            except psycopg2.Error, e:
+                irc.reply('{0}: EXPLAIN failed. "{1}"'.format(
+                    statement.name, str(e).strip()), prefixNick=False)
+                continue
+            checked += 1
+            if scans:
+                slow += 1
+                irc.reply('{0}: {1}'.format(statement.name, ', '.join(
+                    'Seq Scan on {0} (~{1:,.0f} rows)'.format(*scan)
+                    for scan in scans)), prefixNick=False)
+        irc.reply('Checked {0} statements, {1} scan large tables'.format(
+            checked, slow), prefixNick=False)
+    evecheckplans = wrap(evecheckplans, ['admin'])
+
     def evecommands(self, irc, msg, args):
         """
         Prints an overview of available commands
@@ -756,7 +1282,8 @@ class EVESpai(callbacks.Plugin):
                          "{0} {1}".format(ircutils.bold("'chars <user>'"), "List all cha)racters belonging to <user>"),
                          "{0} {1}".format(ircutils.bold("'price [--location=(<solarsystem>|<region>)] <typeName>'"), "List buy/sell/volume of <type> in <location>, defaults to Jita."),
                          "{0} {1}".format(ircutils.bold("'markets'"), "List all price indexed markets."),
-                         "{0} {1}".format(ircutils.bold("'player <character>'"), "List username of those who own *<character>*")))
+                         "{0} {1}".format(ircutils.bold("'player <character>'"), "List username of those who own *<character>*"),
+                         "{0} {1}".format(ircutils.bold("'evestats'"), "Show database pool and cache statistics (admins only).")))
 
         for line in desc.splitlines():
             irc.reply(line.strip(), prefixNick=False)
@@ -0,0 +1,204 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Rollups of stationspinner data kept in memory and brought up to date when
+stationspinner has new data.
+"""
+
+import datetime
+import heapq
+import threading
+
+import names
+
+# journal refTypeIDs of bounty prizes and ESS payouts
+BOUNTY_REF_TYPES = (85, 99)
+
+WINDOWS = {
+    'day': 1,
+    'week': 7,
+    'month': 30,
+    'all': None,
+}
+
+
+class BountyRollup(object):
+    """
+    Bounties per user and day. refresh() only reads journal rows with a
+    refID above the highest one seen so far. Daily sums are kept for the
+    longest window, older days only count towards the all-time totals.
+    """
+    SQL = """
+    SELECT max(j."refID"), j.date::date, u.username, sum(j.amount)
+    FROM corporation_walletjournal j
+    JOIN character_charactersheet c ON c."characterID" = j."ownerID2"
+    JOIN accounting_capsuler u ON u.id = c.owner_id
+    WHERE j.owner_id = %s AND j."refTypeID" = ANY(%s) AND j."refID" > %s
+    GROUP BY j.date::date, u.username"""
+
+    def __init__(self):
+        self.last_refID = 0
+        self.rows = 0
+        self._days = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, query, owner):
+        """
+        Add the new journal rows of corporation owner using query(sql,
+        args), which returns all rows of the statement.
+        """
+        with self._lock:
+            # read everything first, rows come grouped rather than in
+            # refID order and an interrupted read must not move last_refID
+            rows = list(query(self.SQL, [owner, list(BOUNTY_REF_TYPES),
+                                         self.last_refID]))
+            for refID, day, username, amount in rows:
+                self._add(day, username, amount)
+                self.last_refID = max(self.last_refID, refID)
+                self.rows += 1
+            self._prune(datetime.datetime.utcnow().date())
+
+    def _add(self, day, username, amount):
+        users = self._days.setdefault(day, {})
+        users[username] = users.get(username, 0) + amount
+        self._totals[username] = self._totals.get(username, 0) + amount
+
+    def _prune(self, today):
+        oldest = today - datetime.timedelta(days=max(
+            d for d in WINDOWS.values() if d is not None))
+        for day in [d for d in self._days if d < oldest]:
+            del self._days[day]
+
+    def top(self, window='month', limit=5, today=None):
+        """
+        Return up to limit (username, amount) of the users with the most
+        bounties in the last day, week, month or all time.
+        """
+        days = WINDOWS[window]
+        with self._lock:
+            if days is None:
+                totals = self._totals
+            else:
+                today = today or datetime.datetime.utcnow().date()
+                since = today - datetime.timedelta(days=days - 1)
+                totals = {}
+                for day, users in self._days.iteritems():
+                    if day < since:
+                        continue
+                    for username, amount in users.iteritems():
+                        totals[username] = totals.get(username, 0) + amount
+            return heapq.nlargest(limit, totals.iteritems(),
+                                  key=lambda item: item[1])
+
+    def __str__(self):
+        return 'Bounty rollup: {0} users, {1} days, {2} rows read, ' \
+            'last refID {3}'.format(len(self._totals), len(self._days),
+                                    self.rows, self.last_refID)
+
+
+class AssetRollup(object):
+    """
+    Total quantity of each type at each location of the corporation, with
+    name indexes of both the types and the locations. The rollup is
+    rebuilt when it is updated with a new AssetList stamp.
+    """
+    SQL = """
+    SELECT "typeID", "typeName", "locationID", "locationName", sum(quantity)
+    FROM corporation_asset
+    WHERE owner_id = %s
+    GROUP BY "typeID", "typeName", "locationID", "locationName"
+    """
+
+    def __init__(self):
+        self.version = None
+        self._quantities = {}
+        self._locations = {}
+        self._type_names = {}
+        self._location_names = {}
+        self.type_index = names.NameIndex(())
+        self.location_index = names.NameIndex(())
+        self._lock = threading.Lock()
+
+    def update(self, version, query, owner):
+        """
+        Rebuild the rollup from the assets of corporation owner, read with
+        query(sql, args), unless it was built from the same version.
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            quantities = {}
+            locations = {}
+            type_names = {}
+            location_names = {}
+            for typeID, typeName, locationID, locationName, quantity \
+                    in query(self.SQL, [owner]):
+                key = (typeID, locationID)
+                quantities[key] = quantities.get(key, 0) + quantity
+                locations.setdefault(typeID, set()).add(locationID)
+                type_names[typeID] = typeName
+                location_names[locationID] = locationName
+            self._quantities = quantities
+            self._locations = locations
+            self._type_names = type_names
+            self._location_names = location_names
+            self.type_index = names.NameIndex(sorted(
+                type_names.iteritems(), key=lambda item: item[1]))
+            self.location_index = names.NameIndex(sorted(
+                location_names.iteritems(), key=lambda item: item[1]))
+            self.version = version
+
+    def find(self, type_pattern, location_pattern):
+        """
+        Return (typeName, locationName, quantity) for all types and
+        locations matching the ILIKE patterns, ordered by name. Locations
+        or types that share a name are added up into one line.
+        """
+        with self._lock:
+            locationIDs = set(self.location_index.match_all(location_pattern))
+            found = {}
+            for typeID in self.type_index.match_all(type_pattern):
+                for locationID in self._locations.get(typeID, ()):
+                    if locationID in locationIDs:
+                        key = (self._type_names[typeID],
+                               self._location_names[locationID])
+                        found[key] = found.get(key, 0) + \
+                            self._quantities[typeID, locationID]
+        return sorted(key + (quantity,) for key, quantity in found.iteritems())
+
+    def __str__(self):
+        return 'Asset rollup: {0} types, {1} locations, {2} stacks'.format(
+            len(self._type_names), len(self._location_names),
+            len(self._quantities))
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,106 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Compact result rows: tuples whose columns can also be read by name.
+"""
+
+import threading
+
+_types = {}
+_lock = threading.Lock()
+
+
+class Row(tuple):
+    """
+    A tuple of column values. Columns are read by position or by name,
+    'column' in row tests for a column name and get() works like dict.get.
+    The names live on a class shared by all rows with the same columns,
+    see row_type().
+    """
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def __reduce__(self):
+        return make_row, (self._fields, tuple(self))
+
+    def __repr__(self):
+        return 'Row({0})'.format(', '.join(
+            '{0}={1!r}'.format(*item) for item in self.items()))
+
+
+def row_type(fields):
+    """
+    Return the Row subclass for rows with the given column names.
+    """
+    fields = tuple(fields)
+    cls = _types.get(fields)
+    if cls is None:
+        with _lock:
+            cls = _types.get(fields)
+            if cls is None:
+                cls = type('Row', (Row,), {
+                    '__slots__': (),
+                    '_fields': fields,
+                    '_index': dict((f, i) for i, f in enumerate(fields)),
+                })
+                _types[fields] = cls
+    return cls
+
+
+def make_row(fields, values):
+    return row_type(fields)(values)
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
@@ -0,0 +1,237 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+In-process snapshot of the parts of the static data export EVESpai uses.
+
+The SDE only changes between CCP releases, so the plugin loads the tables it
+needs once at startup and answers lookups from memory. Rows are kept as
+tuples keyed by their ID and handed out as rows.Row, see rows.py. Names of
+systems, map items and types are indexed for ILIKE lookups, see names.py.
+"""
+
+import threading
+
+import names
+import rows
+
+SYSTEM_COLUMNS = ('solarSystemID', 'solarSystemName', 'regionID',
+                  'constellationID', 'security')
+LOCATION_COLUMNS = ('itemID', 'typeID', 'groupID', 'solarSystemID',
+                    'constellationID', 'regionID', 'itemName', 'security')
+TYPE_COLUMNS = ('typeID', 'groupID', 'typeName')
+GROUP_COLUMNS = ('groupID', 'categoryID', 'groupName')
+
+# mapDenormalize groups kept in memory: regions, constellations,
+# solar systems, moons and stations.
+LOCATION_GROUPS = (3, 4, 5, 8, 15)
+
+SHIP_CATEGORY = 6
+MOON_GROUP = 8
+
+
+def _select(columns, table):
+    return 'SELECT {0} FROM "{1}" '.format(
+        ', '.join('"{0}"'.format(c) for c in columns), table)
+
+SYSTEM_SQL = _select(SYSTEM_COLUMNS, 'mapSolarSystems')
+LOCATION_SQL = _select(LOCATION_COLUMNS, 'mapDenormalize')
+TYPE_SQL = _select(TYPE_COLUMNS, 'invTypes')
+GROUP_SQL = _select(GROUP_COLUMNS, 'invGroups')
+
+
+def _ids(keys):
+    for key in keys:
+        try:
+            yield int(key)
+        except (TypeError, ValueError):
+            pass
+
+
+class Table(object):
+    """
+    A read-mostly table of rows keyed by their first column.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.row = rows.row_type(columns)
+        self._rows = {}
+
+    def add(self, row):
+        values = tuple(row[i] for i in xrange(len(self.columns)))
+        self._rows[values[0]] = values
+        return self.row(values)
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def resolve(self, keys, sql, query):
+        """
+        Return a dict of key -> row for all keys that exist. Keys missing
+        from the table are fetched together with query(sql, [keys]).
+        """
+        found = {}
+        missing = []
+        for key in set(_ids(keys)):
+            row = self.get(key)
+            if row is not None:
+                found[key] = row
+            else:
+                missing.append(key)
+        if missing:
+            for row in query(sql, [missing]):
+                row = self.add(row)
+                found[row[self.columns[0]]] = row
+        return found
+
+    def _lookup(self, key):
+        return self._rows.get(key)
+
+    def keys(self):
+        return sorted(self._rows)
+
+    def get(self, key):
+        try:
+            values = self._lookup(int(key))
+        except (TypeError, ValueError):
+            return None
+        if values is None:
+            return None
+        return self.row(values)
+
+    def values(self):
+        """
+        Yield the value tuples of all rows in key order.
+        """
+        for key in self.keys():
+            yield self._lookup(key)
+
+    def column(self, column):
+        """
+        Yield (key, value of column) for all rows in key order.
+        """
+        i = self.columns.index(column)
+        for values in self.values():
+            yield values[0], values[i]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class Snapshot(object):
+    """
+    Systems, map items, published types and groups from the SDE.
+    """
+    def __init__(self):
+        self.systems = Table(SYSTEM_COLUMNS)
+        self.locations = Table(LOCATION_COLUMNS)
+        self.types = Table(TYPE_COLUMNS)
+        self.groups = Table(GROUP_COLUMNS)
+        self.index()
+
+    def index(self):
+        self.system_names = names.NameIndex(
+            self.systems.column('solarSystemName'))
+        self.location_names = names.NameIndex(
+            self.locations.column('itemName'))
+        self.type_names = names.NameIndex(self.types.column('typeName'))
+        self.ship_group_names = names.NameIndex(
+            (g[0], g[2]) for g in self.groups.values()
+            if g[1] == SHIP_CATEGORY)
+        self._trigrams = {}
+        self._trigram_lock = threading.Lock()
+        self._group_types = {}
+        for typeID, groupID in self.types.column('groupID'):
+            self._group_types.setdefault(groupID, []).append(typeID)
+
+    def suggest(self, kind, name, limit=5, accept=None):
+        """
+        Return up to limit (ID, name, similarity) tuples of the 'types' or
+        'locations' most similar to name. The trigram indexes are built on
+        first use; moons are left out of the location suggestions.
+        """
+        with self._trigram_lock:
+            trigrams = self._trigrams
+            if kind not in trigrams:
+                if kind == 'types':
+                    items = self.types.column('typeName')
+                else:
+                    i = LOCATION_COLUMNS.index('itemName')
+                    items = ((v[0], v[i]) for v in self.locations.values()
+                             if v[2] != MOON_GROUP)
+                trigrams[kind] = names.TrigramIndex(items)
+        return trigrams[kind].search(name, limit, accept)
+
+    def types_in_group(self, groupID):
+        return [self.types.get(typeID)
+                for typeID in self._group_types.get(groupID, ())]
+
+    def load(self, query):
+        """
+        Fill the snapshot using query(sql), which must return all rows of
+        the statement with the columns in select order.
+        """
+        self.systems.extend(query(SYSTEM_SQL +
+            'ORDER BY "solarSystemID"'))
+        self.locations.extend(query(LOCATION_SQL +
+            'WHERE "groupID" IN ({0}) ORDER BY "itemID"'.format(
+                ', '.join(map(str, LOCATION_GROUPS)))))
+        self.types.extend(query(TYPE_SQL +
+            'WHERE published=true ORDER BY "typeID"'))
+        self.groups.extend(query(GROUP_SQL +
+            'WHERE published=true ORDER BY "groupID"'))
+        self.index()
+        return self
+
+    def resolve(self, query, systems=(), locations=(), types=()):
+        """
+        Bulk lookup of solar systems, map items and types by ID. Returns
+        three dicts of ID -> row. IDs not held in memory cost one
+        = ANY(%s) query per table through query(sql, args).
+        """
+        return (
+            self.systems.resolve(systems, SYSTEM_SQL +
+                'WHERE "solarSystemID" = ANY(%s)', query),
+            self.locations.resolve(locations, LOCATION_SQL +
+                'WHERE "itemID" = ANY(%s)', query),
+            self.types.resolve(types, TYPE_SQL +
+                'WHERE "typeID" = ANY(%s) AND published=true', query))
+
+    def __str__(self):
+        return '{0} systems, {1} locations, {2} types, {3} groups'.format(
+            len(self.systems), len(self.locations),
+            len(self.types), len(self.groups))
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
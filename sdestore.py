@@ -0,0 +1,309 @@
+###
+# Copyright (c) 2014, Kristian Berg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   * Redistributions of source code must retain the above copyright notice,
+#     this list of conditions, and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions, and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+#   * Neither the name of the author of this software nor the name of
+#     contributors to this software may be used to endorse or promote products
+#     derived from this software without specific prior written consent.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+###
+
+"""
+Local, memory-mapped store of the SDE tables held by sde.Snapshot.
+
+A store is a single read-only file built once per SDE release, either from
+the sde database or from the CSV table dumps of the official export:
+
+    python sdestore.py --dsn "host=localhost dbname=sde" evespai.sde
+    python sdestore.py --csv /path/to/dump --release "Crius 1.0" evespai.sde
+
+Opening a store maps the file and only reads the row keys and the indexed
+name columns into memory, rows are decoded on demand. Several bots can share
+one file through the page cache.
+
+File layout: MAGIC, the format version and the length of the marshalled
+header as little endian unsigned ints, the header and the table sections.
+Each table has a sorted array of 64 bit keys, an array of n + 1 32 bit
+record offsets, the marshalled records and marshalled value lists of
+columns needed to build the name indexes.
+"""
+
+import csv
+import marshal
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left
+
+import sde
+
+MAGIC = 'EVESPAI-SDE\0'
+FORMAT_VERSION = 1
+
+_prologue = struct.Struct('<{0}sII'.format(len(MAGIC)))
+
+TABLES = (
+    ('systems', sde.SYSTEM_COLUMNS, ('solarSystemName',)),
+    ('locations', sde.LOCATION_COLUMNS, ('itemName',)),
+    ('types', sde.TYPE_COLUMNS, ('typeName', 'groupID')),
+    ('groups', sde.GROUP_COLUMNS, ()),
+)
+
+
+class StoreError(Exception):
+    pass
+
+
+class MappedTable(sde.Table):
+    """
+    A sde.Table reading its rows from a mapped store. Rows added at runtime
+    are kept in memory on top of the mapped ones.
+    """
+    def __init__(self, columns, buf, section):
+        sde.Table.__init__(self, columns)
+        self._buf = buf
+        self._section = section
+        count = section['count']
+        self._keys = struct.unpack_from('<{0}q'.format(count), buf,
+                                        section['keys'])
+        # keys of the rows added at runtime that are not in the file
+        self._added = set()
+
+    def _position(self, key):
+        i = bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        return i
+
+    def add(self, row):
+        row = sde.Table.add(self, row)
+        key = row[0]
+        if self._position(key) is None:
+            self._added.add(key)
+        return row
+
+    def _lookup(self, key):
+        values = self._rows.get(key)
+        if values is not None:
+            return values
+        i = self._position(key)
+        if i is None:
+            return None
+        start, end = struct.unpack_from('<II', self._buf,
+                                        self._section['offsets'] + 4 * i)
+        base = self._section['records']
+        return marshal.loads(self._buf[base + start:base + end])
+
+    def keys(self):
+        if not self._rows:
+            return self._keys
+        return sorted(set(self._keys).union(self._rows))
+
+    def column(self, column):
+        position = self._section['columns'].get(column)
+        if position is None or self._rows:
+            return sde.Table.column(self, column)
+        start, end = position
+        return iter(zip(self._keys, marshal.loads(self._buf[start:end])))
+
+    def __len__(self):
+        return len(self._keys) + len(self._added)
+
+
+class Store(sde.Snapshot):
+    """
+    A sde.Snapshot backed by a store file.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = _prologue.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise StoreError('{0} is not an SDE store'.format(path))
+        if version != FORMAT_VERSION:
+            raise StoreError('{0} has format version {1}, expected {2}'.format(
+                path, version, FORMAT_VERSION))
+        start = _prologue.size
+        self.header = marshal.loads(self._buf[start:start + length])
+        self.release = self.header['release']
+        for name, columns, _ in TABLES:
+            setattr(self, name, MappedTable(columns, self._buf,
+                                            self.header['tables'][name]))
+        self.index()
+
+    def close(self):
+        self._buf.close()
+
+    def __str__(self):
+        return '{0} ({1})'.format(sde.Snapshot.__str__(self), self.release)
+
+
+def build(snapshot, path, release):
+    """
+    Write snapshot to a store at path. The file is replaced atomically so
+    running bots keep their old mapping until they reopen it.
+    """
+    chunks = []
+    header = {'release': release, 'built': int(time.time()), 'tables': {}}
+
+    def place(data):
+        # offset of data relative to the end of the header
+        offset = sum(len(c) for c in chunks)
+        chunks.append(data)
+        return offset, offset + len(data)
+
+    for name, columns, indexed in TABLES:
+        table = getattr(snapshot, name)
+        keys = list(table.keys())
+        records = [marshal.dumps(table._lookup(key)) for key in keys]
+        offsets = [0]
+        for record in records:
+            offsets.append(offsets[-1] + len(record))
+
+        header['tables'][name] = {
+            'count': len(keys),
+            'keys': place(struct.pack('<{0}q'.format(len(keys)), *keys))[0],
+            'offsets': place(struct.pack('<{0}I'.format(len(offsets)),
+                                         *offsets))[0],
+            'records': place(''.join(records))[0],
+            'columns': dict((column, place(marshal.dumps(
+                                [v for k, v in table.column(column)])))
+                            for column in indexed),
+        }
+
+    # All section offsets are relative to the end of the header until its
+    # size is known, then they are made absolute.
+    base = 0
+    while True:
+        absolute = _absolute(header, base)
+        data = marshal.dumps(absolute)
+        if _prologue.size + len(data) == base:
+            break
+        base = _prologue.size + len(data)
+
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(_prologue.pack(MAGIC, FORMAT_VERSION, len(data)))
+        f.write(data)
+        for chunk in chunks:
+            f.write(chunk)
+    os.rename(tmp, path)
+
+
+def _absolute(header, base):
+    tables = {}
+    for name, section in header['tables'].iteritems():
+        tables[name] = {
+            'count': section['count'],
+            'keys': section['keys'] + base,
+            'offsets': section['offsets'] + base,
+            'records': section['records'] + base,
+            'columns': dict((c, (start + base, end + base))
+                            for c, (start, end)
+                            in section['columns'].iteritems()),
+        }
+    return {'release': header['release'], 'built': header['built'],
+            'tables': tables}
+
+
+def _cast(value):
+    if value in ('', 'None', 'NULL', r'\N'):
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _published(value):
+    return str(value).lower() in ('1', 'true', 't')
+
+
+def load_csv(directory):
+    """
+    Build a sde.Snapshot from CSV dumps of mapSolarSystems, mapDenormalize,
+    invTypes and invGroups with a header line, named after their table.
+    """
+    def rows(table, columns, where=lambda row: True):
+        with open(os.path.join(directory, table + '.csv'), 'rb') as f:
+            for row in csv.DictReader(f):
+                if where(row):
+                    # names are never cast, "1st Thunder" stays a string.
+                    yield [row[c] if c.endswith('Name') else _cast(row[c])
+                           for c in columns]
+
+    snapshot = sde.Snapshot()
+    snapshot.systems.extend(rows('mapSolarSystems', sde.SYSTEM_COLUMNS))
+    snapshot.locations.extend(rows('mapDenormalize', sde.LOCATION_COLUMNS,
+        lambda row: _cast(row['groupID']) in sde.LOCATION_GROUPS))
+    snapshot.types.extend(rows('invTypes', sde.TYPE_COLUMNS,
+        lambda row: _published(row['published'])))
+    snapshot.groups.extend(rows('invGroups', sde.GROUP_COLUMNS,
+        lambda row: _published(row['published'])))
+    return snapshot
+
+
+def load_database(dsn):
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        def query(sql, argslist=None):
+            cur = conn.cursor()
+            cur.execute(sql, argslist)
+            rows = cur.fetchall()
+            cur.close()
+            return rows
+        return sde.Snapshot().load(query)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Build an EVESpai SDE store.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dsn', help='libpq connection string of the sde '
+                        'database')
+    source.add_argument('--csv', help='directory with CSV table dumps')
+    parser.add_argument('--release', help='SDE release name stored in the '
+                        'file, defaults to the build date')
+    parser.add_argument('path', help='store file to write')
+    args = parser.parse_args(argv)
+
+    if args.dsn:
+        snapshot = load_database(args.dsn)
+    else:
+        snapshot = load_csv(args.csv)
+    release = args.release or time.strftime('built %Y-%m-%d')
+    build(snapshot, args.path, release)
+    print '{0}: {1}'.format(args.path, Store(args.path))
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
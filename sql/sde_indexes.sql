@@ -0,0 +1,20 @@
+-- Optional indexes for the queries EVESpai runs against the sde
+-- database, which it does not own. The commands match names with
+-- ILIKE '%...%', which a plain btree cannot serve; pg_trgm GIN indexes
+-- can. Apply as a user allowed to create indexes:
+--
+--     psql -d sde -f sql/sde_indexes.sql
+--
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction, so do not
+-- wrap this file in one. Use 'evecheckplans' afterwards to see which
+-- queries still scan large tables.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- ship, only needed when the SDE snapshot is disabled
+CREATE INDEX CONCURRENTLY IF NOT EXISTS evespai_invgroups_groupname_trgm
+    ON "invGroups" USING gin ("groupName" gin_trgm_ops);
+
+-- location names of members and assets
+CREATE INDEX CONCURRENTLY IF NOT EXISTS evespai_mapdenormalize_itemname_lower
+    ON "mapDenormalize" (lower("itemName"));
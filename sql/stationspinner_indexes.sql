@@ -0,0 +1,35 @@
+-- Optional indexes for the queries EVESpai runs against the stationspinner
+-- database, which it does not own. The commands match names with
+-- ILIKE '%...%', which a plain btree cannot serve; pg_trgm GIN indexes
+-- can. Apply as a user allowed to create indexes:
+--
+--     psql -d stationspinner -f sql/stationspinner_indexes.sql
+--
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction, so do not
+-- wrap this file in one. Use 'evecheckplans' afterwards to see which
+-- queries still scan large tables.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- whereis, whoat
+CREATE INDEX CONCURRENTLY IF NOT EXISTS evespai_membertracking_name_trgm
+    ON corporation_membertracking USING gin (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS evespai_membertracking_location_trgm
+    ON corporation_membertracking USING gin (location gin_trgm_ops);
+
+-- player
+CREATE INDEX CONCURRENTLY IF NOT EXISTS evespai_charactersheet_name_trgm
+    ON character_charactersheet USING gin (name gin_trgm_ops);
+
+-- howmany matches names in its rollup, not in SQL; these only slowed down
+-- asset ingest, so drop them where an earlier version of this file made them
+DROP INDEX CONCURRENTLY IF EXISTS evespai_asset_typename_trgm;
+DROP INDEX CONCURRENTLY IF EXISTS evespai_asset_locationname_trgm;
+
+-- location names of members and assets that are conquerable stations
+CREATE INDEX CONCURRENTLY IF NOT EXISTS evespai_conquerablestation_name_lower
+    ON universe_conquerablestation (lower("stationName"));
+
+-- meinshekels, reads journal rows above the last refID it has seen
+CREATE INDEX CONCURRENTLY IF NOT EXISTS evespai_walletjournal_owner_refid
+    ON corporation_walletjournal (owner_id, "refID");